@@ -0,0 +1,411 @@
+"""
+Benchmark- und Aequivalenz-Suite fuer Simulator und Protokoll (headless).
+Misst Latenz, Spitzenspeicher (tracemalloc) und Durchsatz, vergleicht jede Engine mit der
+Referenz ("tensor") und schreibt einen JSON-Report. Aufruf aus "RIS Software":
+    python benchmarks/bench_simulator.py [--quick] [--output benchmarks/results/bench_report.json]
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.rissimulator import RISsimulator, ENGINES, SAMPLINGS     # noqa: E402
+from lib.RISinterface import RISinterface               # noqa: E402
+from lib.rispool import RISpool                         # noqa: E402
+from lib.sequencer import PatternSequencer              # noqa: E402
+from lib.com_sim import RISSimulatorSerial, RISSimulatorPty     # noqa: E402
+from lib import patterncodec                            # noqa: E402
+from lib.scheduler import CommandScheduler              # noqa: E402
+
+
+REFERENCE = "tensor"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")     # git-ignored
+
+
+def timed(func, repeats):
+    # median latency over repeats, peak traced memory and result of one extra call
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def rel_error(value, reference):
+    return float(np.max(np.abs(value - reference)) / np.max(reference))
+
+
+def random_mask(rng, density):
+    return rng.random((16, 16)) < density
+
+
+#### AF engines ###################################################################################
+def bench_engines(resolutions, densities, freqs, ref_max_resolution, repeats, tolerance):
+    rows = []
+    rng = np.random.default_rng(0)
+    engines = [engine for engine in ENGINES if engine_available(engine)]
+    for resolution in resolutions:
+        for density in densities:
+            for freq in freqs:
+                mask = random_mask(rng, density)
+                reference = None
+                for engine in engines:
+                    if engine == REFERENCE and resolution > ref_max_resolution:
+                        continue    # full 4-D tensor does not fit into memory
+                    sim = RISsimulator()
+                    with sim.update():
+                        sim.set_resolution(resolution)
+                        sim.set_engine(engine)
+                        sim.set_freq(freq)
+                        sim.set_theta_in(0.3)
+                        sim.set_phi_in(0.5)
+                        sim.set_mask_bool(mask)
+                    latency, peak, AF = timed(sim.array_factor_matrix, repeats)
+                    AF = AF.copy()
+                    if engine == REFERENCE:
+                        reference = AF
+                    row = {
+                        "bench": "af", "engine": engine, "resolution": resolution,
+                        "density": density, "freq": freq, "latency_s": latency,
+                        "peak_bytes": peak, "directions_per_s": AF.size / latency,
+                    }
+                    if reference is not None and engine != REFERENCE:
+                        row["rel_error"] = rel_error(AF, reference)
+                        row["equal"] = row["rel_error"] <= tolerance
+                    rows.append(row)
+    return rows
+
+
+def engine_available(engine):
+    try:
+        RISsimulator().set_engine(engine)
+    except ImportError:
+        return False
+    return True
+
+
+#### incremental update, sweeps and batches #######################################################
+def bench_incremental(resolutions, repeats, tolerance):
+    rows = []
+    rng = np.random.default_rng(1)
+    for resolution in resolutions:
+        sim = RISsimulator()
+        sim.set_resolution(resolution)
+        sim.set_mask_bool(random_mask(rng, 0.5))
+        sim.get_af()
+
+        def toggle_one():
+            mask = sim.mask_bool.copy()
+            mask[rng.integers(16), rng.integers(16)] ^= True
+            sim.set_mask_bool(mask)
+            return sim.get_af()
+        latency, peak, AF = timed(toggle_one, repeats)
+        AF = AF.copy()
+        full = sim.array_factor_matrix()
+        error = rel_error(AF, full)
+        rows.append({"bench": "af_delta", "resolution": resolution, "latency_s": latency,
+                     "peak_bytes": peak, "rel_error": error, "equal": error <= tolerance})
+
+        freqs = sim.phase_shift[:, 0]
+        latency, peak, cube = timed(lambda: sim.sweep_freq(freqs), 1)
+        single = []
+        for index in (0, len(freqs) // 2, len(freqs) - 1):
+            sim.set_freq(freqs[index])
+            single.append(rel_error(cube[index], sim.get_af()))
+        rows.append({"bench": "sweep_freq", "resolution": resolution, "n_freq": len(freqs),
+                     "latency_s": latency, "peak_bytes": peak, "freqs_per_s": len(freqs) / latency,
+                     "rel_error": max(single), "equal": max(single) <= tolerance})
+    return rows
+
+
+def bench_batch(n_masks, repeats, tolerance):
+    sim = RISsimulator()
+    rng = np.random.default_rng(2)
+    masks = rng.integers(0, 2, (n_masks, 16, 16), dtype=np.uint8)
+    directions = [[0.3, 0.5], [0.6, 2.0], [0.1, 4.0]]
+    latency, peak, gains = timed(lambda: sim.evaluate_masks(masks, directions), repeats)
+
+    sim.set_resolution(50)
+    full = sim.evaluate_masks(masks[:4])
+    sim.set_mask_bool(masks[3])
+    error = rel_error(full[3], sim.get_af())
+    return [{"bench": "evaluate_masks", "n_masks": n_masks, "n_directions": len(directions),
+             "latency_s": latency, "peak_bytes": peak, "masks_per_s": n_masks / latency,
+             "rel_error": error, "equal": error <= tolerance}]
+
+
+#### sampling of the hemisphere ##################################################################
+def bench_sampling(resolutions, repeats, ref_resolution=1000):
+    # evaluated directions, latency and error of the main lobe peak against a dense grid
+    mask = random_mask(np.random.default_rng(4), 0.5)
+    sim = RISsimulator()
+    with sim.update():
+        sim.set_resolution(ref_resolution)
+        sim.set_theta_in(0.3)
+        sim.set_mask_bool(mask)
+    reference = float(sim.get_af().max())
+    rows = []
+    for resolution in resolutions:
+        for sampling in SAMPLINGS:
+            with sim.update():
+                sim.set_resolution(resolution)
+                sim.set_sampling(sampling)
+            latency, peak, AF = timed(sim.array_factor_matrix, repeats)
+            rows.append({"bench": "sampling", "sampling": sampling, "resolution": resolution,
+                         "n_directions": AF.size, "latency_s": latency, "peak_bytes": peak,
+                         "peak_rel_error": abs(float(AF.max()) - reference) / reference})
+    return rows
+
+
+#### 3D view (needs PySide6 / pyqtgraph) ##########################################################
+def bench_render(resolutions, repeats):
+    try:
+        from lib.rissimulator_ui import RISsimulator_ui, colormap_lut
+    except ImportError as error:
+        return [{"bench": "render", "skipped": str(error)}]
+    rows = []
+    for resolution in resolutions:
+        sim = RISsimulator()
+        sim.set_resolution(resolution)
+        view = types.SimpleNamespace(sim=sim, lut=colormap_lut())
+        RISsimulator_ui.gen_faces(view, resolution)
+        AF = sim.get_af() / sim.get_af().max()
+        latency_v, peak_v, _ = timed(lambda: RISsimulator_ui.gen_vertices(view, AF), repeats)
+        latency_c, peak_c, _ = timed(lambda: RISsimulator_ui.gen_colors_face(view, AF), repeats)
+        rows.append({"bench": "render", "resolution": resolution,
+                     "vertices_latency_s": latency_v, "vertices_peak_bytes": peak_v,
+                     "colors_latency_s": latency_c, "colors_peak_bytes": peak_c})
+    return rows
+
+
+#### pattern encoding / protocol ##################################################################
+def bench_protocol(n_patterns):
+    interface = RISinterface()
+    interface.setPort("DEMO")
+    interface.connect()
+    rng = np.random.default_rng(3)
+    masks = rng.integers(0, 2, (n_patterns, 16, 16))
+
+    mismatches = 0
+    start = time.perf_counter()
+    for mask in masks:
+        interface.set_pattern(mask)
+    latency = (time.perf_counter() - start) / n_patterns
+    for mask in masks[:64]:         # README bit order: element 1 = MSB
+        interface.set_pattern(mask)
+        expected = int("".join(str(int(bit)) for bit in mask.ravel()), 2)
+        mismatches += interface.ser.pattern != expected
+    rows = [{"bench": "set_pattern", "n_patterns": n_patterns, "latency_s": latency,
+             "patterns_per_s": 1 / latency, "equal": mismatches == 0}]
+
+    expected = int("".join(str(int(bit)) for bit in masks[-1].ravel()), 2)
+    rates = {}
+    for window in (1, 8):
+        ok, report = interface.stream_patterns(masks, window=window)
+        rates[window] = report["rate"]
+        rows.append({"bench": "stream_patterns", "n_patterns": n_patterns, "window": window,
+                     "latency_s": float(np.median(report["latency"])), "patterns_per_s": report["rate"],
+                     "speedup_vs_set_pattern": report["rate"] * latency, "speedup_vs_window_1": report["rate"] / rates[1],
+                     "equal": ok and report["ok"] == n_patterns and interface.ser.pattern == expected})
+
+    interval = 2e-3
+    report = PatternSequencer(interface).run(PatternSequencer.periodic(masks, interval))
+    rows.append({"bench": "sequencer", "n_patterns": n_patterns, "interval_s": interval,
+                 "patterns_per_s": report["rate"], "lateness_p99_s": report["lateness"]["p99"],
+                 "lateness_max_s": report["lateness"]["max"], "jitter_p99_s": report["jitter"]["p99"],
+                 "equal": report["ok"] == n_patterns and interface.ser.pattern == expected})
+    interface.disconnect()
+
+    pool = RISpool([f"DEMO:{serialno}" for serialno in range(1, 5)])
+    pool.connect()
+    start = time.perf_counter()
+    for mask in masks:
+        results = pool.broadcast(mask)
+    latency = (time.perf_counter() - start) / n_patterns
+    rows.append({"bench": "pool_broadcast", "n_devices": 4, "n_patterns": n_patterns,
+                 "latency_s": latency, "equal": all(results.values()) and all(
+                     device["interface"].ser.pattern == expected for device in pool.devices.values())})
+    pool.disconnect()
+    return rows
+
+
+def bench_codec(n_patterns):
+    # batch codec against the reference bit string loop (README: element 1 = MSB)
+    rng = np.random.default_rng(6)
+    masks = rng.integers(0, 2, (n_patterns, 16, 16), dtype=np.uint8)
+    start = time.perf_counter()
+    commands = patterncodec.encode_commands(masks)
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = patterncodec.decode_masks(commands)
+    decode = time.perf_counter() - start
+
+    n_ref = min(n_patterns, 2000)
+    start = time.perf_counter()
+    reference = [f"!{int(''.join(str(int(bit)) for bit in mask.ravel()), 2):#0{66}x}\n".encode()
+                 for mask in masks[:n_ref]]
+    ref_rate = n_ref / (time.perf_counter() - start)
+    return [{"bench": "codec", "n_patterns": n_patterns, "encode_per_s": n_patterns / encode,
+             "decode_per_s": n_patterns / decode, "reference_encode_per_s": ref_rate,
+             "equal": commands[:n_ref] == reference and bool((decoded == masks).all())}]
+
+
+def compare_stream(interface, masks, bench, path, windows=(1, 4)):
+    # blocking set_pattern against stream_patterns with several windows on the same connection
+    n_patterns = len(masks)
+    start = time.perf_counter()
+    results = [interface.set_pattern(mask) for mask in masks]
+    set_rate = n_patterns / (time.perf_counter() - start)
+    result, read_back = interface.read_pattern()
+    rows = [{"bench": bench, "path": path, "mode": "set_pattern", "n_patterns": n_patterns,
+             "patterns_per_s": set_rate,
+             "equal": bool(all(results) and result and (read_back == masks[-1]).all())}]
+    rates = {}
+    for window in windows:
+        ok, report = interface.stream_patterns(masks, window=window)
+        rates[window] = report["rate"]
+        result, read_back = interface.read_pattern()
+        rows.append({"bench": bench, "path": path, "mode": "stream_patterns", "window": window,
+                     "n_patterns": n_patterns, "patterns_per_s": report["rate"],
+                     "speedup_vs_set_pattern": report["rate"] / set_rate,
+                     "speedup_vs_window_1": report["rate"] / rates[windows[0]], "failed": len(report["failed"]),
+                     "equal": bool(ok and result and (read_back == masks[-1]).all())})
+    return rows
+
+
+def bench_serial_timing(n_patterns):
+    # 115.2 kBd line model in process and, on POSIX, the unmodified pyserial path via a pty
+    rng = np.random.default_rng(5)
+    masks = rng.integers(0, 2, (n_patterns, 16, 16))
+
+    interface = RISinterface()
+    interface.setPort("DEMO")
+    interface.connect()
+    interface.ser = RISSimulatorSerial(timing=True)
+    rows = compare_stream(interface, masks, "serial_timing", "in-process")
+    rows[0]["overruns"] = interface.ser.overruns
+    interface.disconnect()
+
+    try:
+        stand_in = RISSimulatorPty()
+        port = stand_in.start()
+    except (ImportError, OSError) as error:
+        rows.append({"bench": "serial_timing", "path": "pty", "skipped": str(error)})
+        return rows
+    try:
+        interface = RISinterface()
+        interface.setPort(port)
+        interface.connect()
+        rows += compare_stream(interface, masks, "serial_timing", "pty")
+        interface.disconnect()
+    finally:
+        stand_in.stop()
+    return rows
+
+
+def bench_telemetry(n_patterns, interval=10e-3):
+    # pattern latency on the 115.2 kBd line model with and without ?Vext polling in the gaps
+    rng = np.random.default_rng(7)
+    masks = rng.integers(0, 2, (n_patterns, 16, 16))
+    rows = []
+    for telemetry_interval, idle_gap in ((None, 0.0), (1.0, 50e-3), (5e-3, 1e-3)):
+        interface = RISinterface()
+        interface.setPort("DEMO")
+        interface.connect()
+        interface.ser = RISSimulatorSerial(timing=True)
+        scheduler = CommandScheduler(interface, telemetry_interval, idle_gap)
+        scheduler.start()
+        latency = []
+        results = []
+        for mask in masks:
+            start = time.perf_counter()
+            results.append(scheduler.set_pattern(mask))
+            latency.append(time.perf_counter() - start)
+            time.sleep(interval)
+        scheduler.stop()
+        stats = scheduler.stats()
+        rows.append({"bench": "telemetry", "telemetry_interval_s": telemetry_interval, "idle_gap_s": idle_gap,
+                     "n_patterns": n_patterns, "latency_p50_s": float(np.median(latency)),
+                     "latency_max_s": float(np.max(latency)), "samples": stats["samples"],
+                     "delayed_by_telemetry": stats["delayed_by_telemetry"],
+                     "equal": all(results) and interface.ser.overruns == 0
+                     and interface.ser.pattern == interface.device_pattern})
+        interface.disconnect()
+    return rows
+
+
+###################################################################################################
+def environment():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="small grid for a fast check")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "bench_report.json"))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="max. relative AF error")
+    parser.add_argument("--ref-max-resolution", type=int, default=250,
+                        help="largest resolution for the memory hungry reference engine")
+    args = parser.parse_args()
+
+    if args.quick:
+        resolutions, densities, freqs, repeats = [50, 100], [0.5], [5.15e9], 3
+    else:
+        resolutions, densities, freqs, repeats = [50, 100, 200, 400, 1000], [0.0, 0.25, 0.5], \
+            [5.15e9, 5.5e9, 5.875e9], args.repeats
+
+    results = []
+    results += bench_engines(resolutions, densities, freqs, args.ref_max_resolution, repeats, args.tolerance)
+    results += bench_incremental(resolutions, repeats, args.tolerance)
+    results += bench_sampling(resolutions, repeats)
+    results += bench_batch(1000 if args.quick else 20000, repeats, args.tolerance)
+    results += bench_render(resolutions, repeats)
+    results += bench_protocol(200 if args.quick else 2000)
+    results += bench_codec(20000 if args.quick else 200000)
+    results += bench_serial_timing(50 if args.quick else 500)
+    results += bench_telemetry(50 if args.quick else 500)
+
+    report = {"environment": environment(), "reference_engine": REFERENCE,
+              "tolerance": args.tolerance, "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for row in results:
+        fields = " ".join(f"{key}={value:.4g}" if isinstance(value, float) else f"{key}={value}"
+                          for key, value in row.items() if key != "bench")
+        print(f"{row['bench']:<15} {fields}")
+    failed = [row for row in results if row.get("equal") is False]
+    print(f"\n{len(results)} results, {len(failed)} equivalence failures, report: {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
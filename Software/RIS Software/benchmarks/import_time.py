@@ -0,0 +1,41 @@
+"""
+Misst die Startzeit kurzlebiger Prozesse: jeder Fall laeuft in einem frischen Interpreter,
+gemessen wird die Zeit fuer den Import (ohne Interpreter-Start). Aufruf aus "RIS Software":
+    python benchmarks/import_time.py [repeats]
+"""
+import os
+import sys
+import subprocess
+import statistics
+
+
+CASES = {
+    "import lib":                   "import lib",
+    "lib.RISinterface":             "import lib; lib.RISinterface",
+    "lib.RISinterface (script)":    "from lib.RISinterface import RISinterface",
+    "lib.RISsimulator":             "import lib; lib.RISsimulator",
+    "lib.MainWindow (GUI)":         "import lib; lib.MainWindow",
+}
+
+
+def measure(statement, repeats):
+    code = ("import time; t = time.perf_counter(); {}; "
+            "print(time.perf_counter() - t)").format(statement)
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times), ""
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, statement in CASES.items():
+        median, error = measure(statement, repeats)
+        if median is None:
+            print(f"{name:<24} failed: {error}")
+        else:
+            print(f"{name:<24} {median*1000:8.1f} ms (median of {repeats})")
@@ -1,8 +1,34 @@
+import time
+from collections import deque
+
+import numpy as np
 from lib.com_sim import RISSimulatorSerial
+from lib.metrics import metrics
+from lib.patterncodec import (pattern_int, command_from_int, int_from_hex, decode_masks, pack, ints_from_packed,
+                              commands_from_packed)
 import serial
 import serial.tools.list_ports
 
 
+def pattern_command(state_matrix) -> bytes:
+    return command_from_int(pattern_int(state_matrix))
+
+
+def wait_until(deadline, spin=1e-3):
+    # sleep until shortly before the deadline (perf_counter), then busy wait;
+    # sleep(0) releases the GIL so other threads (GUI, simulator) are not starved
+    remaining = deadline - spin - time.perf_counter()
+    if remaining > 0:
+        time.sleep(remaining)
+    while time.perf_counter() < deadline:
+        time.sleep(0)
+
+
+def pattern_from_hex(hex_str, rows=16, cols=16) -> np.ndarray:
+    # "?Pattern" reply (64 hex digits, without "#0X") -> rows x cols uint8 matrix
+    return decode_masks(hex_str, rows, cols)[0]
+
+
 ###################################################################################################
 #### class definition #############################################################################
 ###################################################################################################
@@ -10,6 +36,18 @@ class RISinterface:
     def __init__(self):
         self.connected = False
         self.Port = []
+        self.timeout = 1.0          # reply timeout in s
+        self.baudrate = 115200      # see README, 8N1
+        # the firmware answers blocking and drops a command that begins before "#OK\n" is sent,
+        # stream_patterns therefore paces by command + processing_delay + reply (see _busy_time)
+        self.processing_delay = 50e-6   # s from the end of a command to the start of its reply
+
+        # last pattern acknowledged by the board (256 bit int), None if unknown
+        self.device_pattern = None
+        self.skip_redundant = True  # set_pattern does not resend the pattern the board holds
+        self.verify_every = 0       # read back with ?Pattern after every n-th write (0: never)
+        self.verify_on_error = True # read back after failed writes and resets
+        self._writes = 0
 
 
 ###################################################################################################
@@ -36,17 +74,21 @@ class RISinterface:
         if self.connected:
             return (True, "RIS already connected")
         else:
-            if self.Port != "DEMO":
+            if not self.Port.startswith("DEMO"):
                 self.ser = serial.Serial(
                     port= self.Port,
-                    baudrate=9600,
+                    baudrate=self.baudrate,
                     bytesize=8,
-                    stopbits=serial.STOPBITS_ONE)
-            else:
+                    stopbits=serial.STOPBITS_ONE,
+                    timeout=self.timeout)
+            elif self.Port == "DEMO":
                 self.ser = RISSimulatorSerial()
+            else:                   # "DEMO:<serial no>", e.g. several simulated boards in a RISpool
+                self.ser = RISSimulatorSerial(int(self.Port.split(":", 1)[1]))
 
             if self.ser.isOpen():
                 self.connected = True
+                self.device_pattern = None
                 return (True, "connection established")
             else:
                 return (False, "connection failed")
@@ -64,53 +106,182 @@ class RISinterface:
 
 
     def set_pattern(self, state_matrix:list[list[int]]) -> tuple[bool, str]:
-        bit_list = [int(value) for row in state_matrix for value in row]
-        bit_string = "".join(map(str,bit_list))
-        bit_int = int(bit_string, 2)
-        tx_str = f"!{bit_int:#0{66}x}\n"
-
-        self.ser.write(tx_str.encode())
-        # TODO: timeout
-        try:
-            rx_msg = self.ser.readline(1).decode()
-        except:
-            rx_msg = ""
+        bit_int = pattern_int(state_matrix)
+        if self.skip_redundant and bit_int == self.device_pattern:
+            metrics.count("patterns_skipped")
+            return True
+
+        with metrics.timer("serial_roundtrip"):
+            self.ser.write(command_from_int(bit_int))
+            try:
+                rx_msg = self._readline(self.timeout).decode()
+            except (serial.SerialException, UnicodeDecodeError):
+                rx_msg = ""
 
+        self._writes += 1
         if rx_msg == "#OK\n":
+            metrics.count("patterns_set")
+            self.device_pattern = bit_int
+            if self.verify_every and self._writes % self.verify_every == 0:
+                return self.verify_pattern()
             return True
         else:
+            metrics.count("serial_errors")
+            self.device_pattern = None
+            if self.verify_on_error:
+                self.verify_pattern()       # learn what the board actually holds
+            return False
+
+
+    def verify_pattern(self) -> bool:
+        """
+        Liest das Muster per ?Pattern zurueck und vergleicht es mit dem zuletzt quittierten.
+        Danach gilt das gelesene Muster als Zustand des Boards (None wenn nicht lesbar).
+        """
+        result, text = self.get_pattern()
+        if not result:
+            self.device_pattern = None
             return False
+        read_back = int_from_hex(text)
+        match = read_back == self.device_pattern
+        metrics.count("pattern_verified" if match else "pattern_mismatch")
+        self.device_pattern = read_back
+        return match
+
+
+    def stream_patterns(self, patterns, window=4, timeout=1.0) -> tuple[bool, dict]:
+        """
+        Sendet viele Muster ohne auf jede Quittung einzeln zu warten: bis zu window Befehle sind
+        gleichzeitig unterwegs, die #OK werden der Reihe nach den aeltesten offenen Befehlen
+        zugeordnet. Kommt innerhalb von timeout keine Antwort, gilt der aelteste Befehl als
+        fehlgeschlagen. Rueckgabe (alle ok, report) mit report = {"sent", "ok", "failed"
+        (Indizes), "latency" (s je Muster, nan bei Fehler), "elapsed", "rate" (Muster/s)}.
+        Die Firmware quittiert ungueltige Befehle nicht; da die Befehle hier selbst codiert
+        werden, tritt das nur bei Uebertragungsfehlern auf, eine spaetere #OK kann dann einem
+        frueheren Befehl zugeordnet werden.
+        Solange Befehle offen sind, beginnt der naechste erst, wenn die Firmware den vorherigen
+        empfangen, bearbeitet und quittiert hat (_busy_time), sonst verwirft sie ihn. Der Gewinn
+        gegenueber set_pattern ist die eingesparte Antwortlatenz (USB, Betriebssystem), nicht
+        die Leitung. Kommt ein Befehl beim Geraet verspaetet an (USB, ausgelasteter Host), kann
+        der folgende verworfen werden; dann window=1 verwenden oder processing_delay erhoehen.
+        Ein numpy array (K, 16, 16) wird vorab als Ganzes codiert, sonst jedes Muster einzeln.
+        """
+        if isinstance(patterns, np.ndarray):
+            packed = pack(patterns)
+            encoded = zip(ints_from_packed(packed), commands_from_packed(packed))
+        else:
+            encoded = ((bit_int := pattern_int(pattern), command_from_int(bit_int)) for pattern in patterns)
+        pending = deque()       # (index, send time, pattern) of commands waiting for #OK
+        latency = []
+        failed = []
+        sent = 0
+        exhausted = False
+
+        start = time.perf_counter()
+        next_send = start
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    bit_int, command = next(encoded)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if pending:
+                    wait_until(next_send, spin=0)     # a minimum gap, no precise timing
+                self.ser.write(command)
+                t_sent = time.perf_counter()
+                next_send = t_sent + self._busy_time(len(command))
+                pending.append((sent, t_sent, bit_int))
+                sent += 1
+            if not pending:
+                break
+
+            rx_msg = self._readline(timeout)
+            index, t_sent, bit_int = pending.popleft()
+            if rx_msg == b"#OK\n":
+                self.device_pattern = bit_int
+                latency.append(time.perf_counter() - t_sent)
+                metrics.observe("stream_ack", latency[-1])
+                metrics.count("patterns_set")
+            else:
+                latency.append(np.nan)
+                failed.append(index)
+                self.device_pattern = None
+                metrics.count("serial_errors")
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "sent": sent,
+            "ok": sent - len(failed),
+            "failed": failed,
+            "latency": np.array(latency),
+            "elapsed": elapsed,
+            "rate": sent / elapsed if elapsed > 0 else 0.0,
+        }
+        return (not failed, report)
+
+
+    def _busy_time(self, n_bytes) -> float:
+        # s the firmware is busy with a command of n_bytes: reception, processing, "#OK\n"
+        if isinstance(self.ser, RISSimulatorSerial):
+            if not self.ser.timing:
+                return 0.0      # no line model, nothing to wait for
+            return (n_bytes + 4) * self.ser.byte_time + self.ser.processing_delay
+        return (n_bytes + 4) * 10 / self.baudrate + self.processing_delay
+
+
+    def _readline(self, timeout) -> bytes:
+        # one reply line, b"" after timeout s (simulator: timeout argument, pyserial: port timeout)
+        if isinstance(self.ser, RISSimulatorSerial):
+            return self.ser.readline(timeout)
+        if self.ser.timeout != timeout:     # the setter reconfigures the port (termios / ioctl)
+            self.ser.timeout = timeout
+        return self.ser.readline()
 
 
     def get_pattern(self) -> tuple[bool, str]:                      # TODO: table update missing
-        self.ser.write("?pattern".encode())
-        rx_msg = self.ser.readline(1).decode()
-        if len(rx_msg) == 68:
-            print(rx_msg[3:-1])
+        with metrics.timer("serial_roundtrip"):
+            self.ser.write("?Pattern\n".encode())
+            rx_msg = self._readline(self.timeout).decode()
+        if len(rx_msg) == 68 and rx_msg.startswith("#0X"):
             return (True, rx_msg[3:-1])
         else:
+            metrics.count("serial_errors")
             return (False, "Error: read Pattern failed!")
 
 
+    def read_pattern(self) -> tuple[bool, np.ndarray]:
+        # current pattern of the board as 16 x 16 matrix
+        result, text = self.get_pattern()
+        if not result:
+            return (False, None)
+        return (True, pattern_from_hex(text))
+
+
     def get_extVoltage(self) -> tuple[bool, str]:
-        self.ser.write("?vext".encode())
-        rx_msg = self.ser.readline(1).decode()[:-1]
+        with metrics.timer("serial_roundtrip"):
+            self.ser.write("?Vext\n".encode())
+            rx_msg = self._readline(self.timeout).decode()[:-1]
         return (True, rx_msg)
 
 
     def get_serialnumber(self) -> tuple[bool, str]:
-        self.ser.write("?SerialNo".encode())
-        rx_msg = self.ser.readline(1).decode()[:-1]
+        with metrics.timer("serial_roundtrip"):
+            self.ser.write("?SerialNo\n".encode())
+            rx_msg = self._readline(self.timeout).decode()[:-1]
         return (True, rx_msg)
 
 
     def reset(self) -> tuple[bool, list[str]]:        # TODO: kanzen string zurückliefern
-        self.ser.write("!Reset".encode())
+        self.ser.write("!Reset\n".encode())
         rx_msg = []
         for _ in range(8):
-            rx_msg.append(self.ser.readline(10).decode()[:-1])
-            print(rx_msg[-1])
+            rx_msg.append(self._readline(10).decode()[:-1])
             if rx_msg[-1] == "#READY!":
+                self.device_pattern = 0     # all elements off after boot
+                if self.verify_on_error:
+                    self.verify_pattern()
                 return (True, rx_msg)
+        self.device_pattern = None
         return (False, ["Error: Reset failed!"])
 
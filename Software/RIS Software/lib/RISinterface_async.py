@@ -0,0 +1,159 @@
+import time
+import asyncio
+
+from lib.com_sim import RISSimulatorSerial
+from lib.RISinterface import pattern_command
+from lib.metrics import metrics
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class AsyncRISSimulatorSerial(RISSimulatorSerial):
+    """
+    asyncio Gegenstueck zu RISSimulatorSerial, ersetzt (StreamReader, StreamWriter) einer
+    seriellen Verbindung: write() / await drain() / await readline() / close().
+    Muss innerhalb eines laufenden Event-Loops erzeugt werden.
+    """
+    def __init__(self, serialno=42, timing=False, baudrate=115200, processing_delay=50e-6):
+        super().__init__(serialno, timing, baudrate, processing_delay)
+        self._loop = asyncio.get_running_loop()
+        self._rx_async = asyncio.Queue()
+
+    def _deliver(self, t_ready, data: bytes):
+        # also called from the reset timer thread
+        delay = max(0.0, t_ready - time.perf_counter())
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay, self._rx_async.put_nowait, data)
+
+    async def readline(self) -> bytes:
+        return await self._rx_async.get()
+
+    async def drain(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        return self._rx_async.qsize()
+
+
+class AsyncRISinterface:
+    """
+    asyncio Client mit dem Befehlssatz von RISinterface. Jeder Befehl hat ein eigenes timeout,
+    Befehl und Antwort laufen unter einem Lock, so dass mehrere Tasks (Muster, Vext-Abfrage, ...)
+    denselben Port in einem Event-Loop ohne Threads nutzen koennen.
+        ris = AsyncRISinterface("DEMO")
+        await ris.connect()
+        await asyncio.gather(ris.set_pattern(mask), ris.get_extVoltage())
+    Fuer echte Ports wird pyserial-asyncio benoetigt (import erst in connect()).
+    """
+    def __init__(self, port="DEMO", baudrate=115200, timeout=1.0):
+        self.Port = port
+        self.baudrate = baudrate
+        self.timeout = timeout          # default timeout per command in s
+        self.connected = False
+        self.reader = None
+        self.writer = None
+        self._lock = None
+        self._desync = False            # a reply timed out, it may still arrive later
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    async def connect(self) -> tuple[bool, str]:
+        if self.connected:
+            return (True, "RIS already connected")
+        if self.Port == "DEMO":
+            self.reader = self.writer = AsyncRISSimulatorSerial()
+        else:
+            try:
+                import serial_asyncio
+            except ImportError:
+                return (False, "pyserial-asyncio is required for the asyncio client")
+            self.reader, self.writer = await serial_asyncio.open_serial_connection(
+                url=self.Port, baudrate=self.baudrate)
+        self._lock = asyncio.Lock()
+        self.connected = True
+        return (True, "connection established")
+
+
+    async def disconnect(self) -> tuple[bool, str]:
+        if not self.connected:
+            return (True, "No RIS connected")
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.connected = False
+        return (True, "RIS disconnected")
+
+
+#### communication functions ######################################################################
+    async def command(self, tx_msg: bytes, timeout=None) -> bytes:
+        # one request / reply pair, b"" on timeout
+        async with self._lock:
+            if self._desync:
+                await self._discard_late_replies()
+            with metrics.timer("serial_roundtrip"):
+                self.writer.write(tx_msg)
+                await self.writer.drain()
+                try:
+                    return await asyncio.wait_for(self.reader.readline(), timeout or self.timeout)
+                except asyncio.TimeoutError:
+                    self._desync = True
+                    metrics.count("serial_timeouts")
+                    return b""
+
+
+    async def _discard_late_replies(self, quiet=0.02):
+        # drop replies of timed out commands, they would be taken for the next reply
+        while True:
+            try:
+                await asyncio.wait_for(self.reader.readline(), quiet)
+            except asyncio.TimeoutError:
+                break
+        self._desync = False
+
+
+    async def set_pattern(self, state_matrix, timeout=None) -> bool:
+        rx_msg = await self.command(pattern_command(state_matrix), timeout)
+        if rx_msg == b"#OK\n":
+            metrics.count("patterns_set")
+            return True
+        metrics.count("serial_errors")
+        return False
+
+
+    async def get_pattern(self, timeout=None) -> tuple[bool, str]:
+        rx_msg = (await self.command(b"?Pattern\n", timeout)).decode()
+        if len(rx_msg) == 68 and rx_msg.startswith("#0X"):
+            return (True, rx_msg[3:-1])
+        metrics.count("serial_errors")
+        return (False, "Error: read Pattern failed!")
+
+
+    async def get_extVoltage(self, timeout=None) -> tuple[bool, str]:
+        rx_msg = (await self.command(b"?Vext\n", timeout)).decode()
+        return (rx_msg.startswith("#"), rx_msg[:-1])
+
+
+    async def get_serialnumber(self, timeout=None) -> tuple[bool, str]:
+        rx_msg = (await self.command(b"?SerialNo\n", timeout)).decode()
+        return (rx_msg.startswith("#"), rx_msg[:-1])
+
+
+    async def reset(self, timeout=5.0) -> tuple[bool, list[str]]:
+        # boot messages until "#READY!", timeout for the whole reset
+        async with self._lock:
+            self.writer.write(b"!Reset\n")
+            await self.writer.drain()
+            rx_msg = []
+            try:
+                async with asyncio.timeout(timeout):
+                    while not rx_msg or rx_msg[-1] != "#READY!":
+                        rx_msg.append((await self.reader.readline()).decode()[:-1])
+            except asyncio.TimeoutError:
+                self._desync = True         # rest of the boot messages may still arrive
+                return (False, ["Error: Reset failed!"])
+            return (True, rx_msg)
@@ -63,6 +63,18 @@ class ToggleTable(QTableWidget):
         self.update_ris()
 
 
+    # set state of every item from a rows x cols matrix (e.g. a calculated pattern)
+    def set_state_matrix(self, state_matrix):
+        for row in range(self.rowCount()):
+            for col in range(self.columnCount()):
+                new_state = bool(state_matrix[row][col])
+                item = self.item(row, col)
+                item.setBackground(QColor("green") if new_state else QColor("lightgray"))
+                item.setData(Qt.UserRole, new_state)
+        self.clearSelection()
+        self.update_ris()
+
+
     def update_ris(self):
         state_matrix = [[int(self.item(row,col).data(Qt.UserRole)) for col in range(self.columnCount())] for row in range(self.rowCount())]
         if self.RIS_controler_update_func(state_matrix):
@@ -6,18 +6,61 @@
 __version__ = "1.1.0"
 
 
-from .mainwindow import MainWindow
-# unused classes in main.py (only unsed in lib)
-# from .Toggletable import ToggleTable
-# from .RIScontroller import RIScontroller
-# from .com_sim import RISSimulatorSerial
-# from .RISinterface import RISinterface
-
-
-__all__ = [
-    "MainWindow",
-    "ToggleTable",
-    "RIScontroller",
-    "RISSimulatorSerial",
-    "RISinterface"
-]
\ No newline at end of file
+import sys
+import types
+import importlib
+
+# RISinterface is bound eagerly (headless, numpy / pyserial only): the submodule lib/RISinterface.py
+# has the same name, importing it from another submodule would otherwise shadow the class
+from .RISinterface import RISinterface
+
+# further classes are imported lazily on first attribute access (PEP 562):
+# core classes (RISSimulatorSerial, RISsimulator, ...) work without Qt / display,
+# GUI classes pull in PySide6 and pyqtgraph only when they are actually used
+_headless_imports = {
+    "RISSimulatorSerial":   ".com_sim",
+    "AsyncRISinterface":    ".RISinterface_async",
+    "AsyncRISSimulatorSerial": ".RISinterface_async",
+    "RISpool":              ".rispool",
+    "PatternSequencer":     ".sequencer",
+    "CommandScheduler":     ".scheduler",
+    "RISsimulator":         ".rissimulator",
+    "BeamCodebook":         ".codebook",
+    "SweepRunner":          ".sweeprunner",
+}
+_gui_imports = {        # need PySide6
+    "MainWindow":           ".mainwindow",
+    "ToggleTable":          ".Toggletable",
+    "RIScontroller":        ".RIScontroller",
+    "RISsimulator_ui":      ".rissimulator_ui",
+    "SimulationWorker":     ".simworker",
+}
+_lazy_imports = {**_headless_imports, **_gui_imports}
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        module = importlib.import_module(_lazy_imports[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value     # cache, __getattr__ is only called once per name
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_imports))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # importing a submodule binds it to the package: lib.RIScontroller (module) must not
+        # hide the lazy class of the same name
+        if name in _lazy_imports and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
+# "from lib import *" has to work without PySide6
+__all__ = ["RISinterface"] + list(_headless_imports)
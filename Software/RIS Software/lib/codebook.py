@@ -0,0 +1,121 @@
+import numpy as np
+
+try:    # import as package (lib.codebook)
+    from .patterncodec import pack, unpack, commands_from_packed
+except ImportError:     # import if codebook.py is executed
+    from patterncodec import pack, unpack, commands_from_packed
+
+
+# file layout: 128 byte header, followed by one 36 byte record per grid point
+# records are ordered [freq, theta, phi] (phi fastest)
+CODEBOOK_MAGIC = b"RISCB1\0\0"
+HEADER_FIELDS = [
+    ("magic", "S8"),
+    ("rows", "<u2"), ("cols", "<u2"),
+    ("theta_start", "<f8"), ("theta_stop", "<f8"), ("n_theta", "<u4"),
+    ("phi_start", "<f8"), ("phi_stop", "<f8"), ("n_phi", "<u4"),
+    ("freq_start", "<f8"), ("freq_stop", "<f8"), ("n_freq", "<u4"),
+    ("theta_i", "<f8"), ("phi_i", "<f8"),
+]
+HEADER_SIZE = 128
+HEADER_DTYPE = np.dtype(HEADER_FIELDS + [("reserved", "u1", HEADER_SIZE - np.dtype(HEADER_FIELDS).itemsize)])
+RECORD_DTYPE = np.dtype([("pattern", "u1", 32), ("gain", "<f4")])   # 256 bit, element 1 = MSB
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class BeamCodebook:
+    """
+    Vorberechnete 1-bit Muster auf einem regelmaessigen (theta, phi, f) Raster.
+    Die Datei wird per np.memmap geladen, lookup() bestimmt den naechsten Rasterpunkt in O(1)
+    und liefert eine 16x16 Maske, die direkt an RISinterface.set_pattern uebergeben werden kann.
+    theta, phi in rad, phi ueberdeckt [phi_start, phi_stop) ohne Endpunkt, theta/f mit Endpunkt.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.header = np.fromfile(fname, dtype=HEADER_DTYPE, count=1)[0]
+        if self.header["magic"] != CODEBOOK_MAGIC.rstrip(b"\0"):
+            raise ValueError(f"{fname} is not a RIS codebook file")
+
+        self.shape = (int(self.header["n_freq"]), int(self.header["n_theta"]), int(self.header["n_phi"]))
+        self.records = np.memmap(fname, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=self.shape)
+
+        self.rows, self.cols = int(self.header["rows"]), int(self.header["cols"])
+        self.theta_i, self.phi_i = float(self.header["theta_i"]), float(self.header["phi_i"])
+        self.thetas = np.linspace(self.header["theta_start"], self.header["theta_stop"], self.shape[1])
+        self.phis = np.linspace(self.header["phi_start"], self.header["phi_stop"], self.shape[2], endpoint=False)
+        self.freqs = np.linspace(self.header["freq_start"], self.header["freq_stop"], self.shape[0])
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    @classmethod
+    def build(cls, fname, sim, theta=(0, np.pi/3, 31), phi=(0, 2*np.pi, 72), freqs=(5.15e9, 5.875e9, 4)):
+        """
+        Berechnet mit sim.synthesize_beam fuer jeden Rasterpunkt ein Muster und schreibt die
+        Codebuch-Datei. theta/phi/freqs sind (start, stop, anzahl). Einfallsrichtung ist die
+        aktuelle des Simulators, dessen Frequenz wird danach wiederhergestellt.
+        """
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = CODEBOOK_MAGIC
+        header["rows"], header["cols"] = sim.M, sim.N
+        header["theta_start"], header["theta_stop"], header["n_theta"] = theta
+        header["phi_start"], header["phi_stop"], header["n_phi"] = phi
+        header["freq_start"], header["freq_stop"], header["n_freq"] = freqs
+        header["theta_i"], header["phi_i"] = sim.theta_i, sim.phi_i
+        header.tofile(fname)
+
+        thetas = np.linspace(*theta)
+        phis = np.linspace(*phi, endpoint=False)
+        shape = (int(freqs[2]), len(thetas), len(phis))
+        records = np.memmap(fname, dtype=RECORD_DTYPE, mode="r+", offset=HEADER_SIZE, shape=shape)
+
+        freq_before = sim.freq
+        for i_f, freq in enumerate(np.linspace(*freqs)):
+            sim.set_freq(freq)
+            for i_t, theta_r in enumerate(thetas):
+                for i_p, phi_r in enumerate(phis):
+                    mask, gain = sim.synthesize_beam(theta_r, phi_r)
+                    records[i_f, i_t, i_p] = (pack(mask, sim.M, sim.N)[0], gain)
+        records.flush()
+        del records
+        sim.set_freq(freq_before)
+        return cls(fname)
+
+
+    def index(self, theta, phi, freq=None):
+        # nearest grid point, phi is periodic if the grid covers the full circle
+        i_t = self._nearest(theta, self.thetas)
+        phi_span = self.header["phi_stop"] - self.header["phi_start"]
+        if np.isclose(phi_span, 2*np.pi):
+            step = phi_span / self.shape[2]
+            i_p = int(np.round(((phi - self.header["phi_start"]) % (2*np.pi)) / step)) % self.shape[2]
+        else:
+            i_p = self._nearest(phi, self.phis)
+        i_f = 0 if freq is None else self._nearest(freq, self.freqs)
+        return i_f, i_t, i_p
+
+
+    def lookup(self, theta, phi, freq=None) -> tuple[np.ndarray, float]:
+        record = self.records[self.index(theta, phi, freq)]
+        mask = unpack(record["pattern"], self.rows, self.cols)[0]
+        return mask, float(record["gain"])
+
+
+    def commands(self) -> list[bytes]:
+        # set pattern commands ("!0x...\n") of all grid points in record order
+        return commands_from_packed(self.records["pattern"].reshape((-1, self.records["pattern"].shape[-1])))
+
+
+    @staticmethod
+    def _nearest(value, axis):
+        if len(axis) == 1:
+            return 0
+        step = (axis[-1] - axis[0]) / (len(axis) - 1)
+        return int(np.clip(np.round((value - axis[0]) / step), 0, len(axis) - 1))
+
+
+    def __len__(self):
+        return self.records.size
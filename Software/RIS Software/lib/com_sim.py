@@ -1,53 +1,104 @@
+import os
 import re
+import time
 import threading
-from queue import Queue
+from collections import deque
+
+try:    # import as package (lib.com_sim)
+    from .metrics import metrics
+    from .patterncodec import int_from_hex, reply_from_int
+except ImportError:     # import if com_sim.py is executed
+    from metrics import metrics
+    from patterncodec import int_from_hex, reply_from_int
 
 class RISSimulatorSerial:
-    def __init__(self):
-        self._rx_queue = Queue()
+    """
+    Simuliert die Firmware an einem seriellen Port (write / readline / close wie pyserial).
+    Befehle werden wie im Controller erst mit "\n" ausgefuehrt, auch ueber mehrere write().
+    timing=True modelliert die Leitung (8N1, baudrate) und die Verarbeitungszeit der Firmware:
+    Antworten sind erst nach Empfang des Befehls, processing_delay und ihrer eigenen
+    Uebertragungszeit lesbar. Beginnt ein Befehl, waehrend die Firmware noch den vorherigen
+    bearbeitet oder beantwortet, verwirft sie ihn wie der Controller (overruns).
+    overrun_tolerance (s) laesst Befehle zu, die hoechstens so viel zu frueh beginnen, fuer
+    Empfangszeiten mit Jitter (RISSimulatorPty).
+    """
+    def __init__(self, serialno=42, timing=False, baudrate=115200, processing_delay=50e-6, overrun_tolerance=0.0):
+        self._rx = deque()      # (time readable, reply) towards the host
         self._tx_log = []
         self._closed = False
         self.pattern = 0x0000000000000000000000000000000000000000000000000000000000000000
         self.vext = 5.00
-        self.serialno = " 42"
+        self.serialno = f"{serialno:3d}"
         self.bt_key = None
         self.lock = threading.RLock()
+        self._rx_ready = threading.Condition(self.lock)
         self._booted = True
+        self.verbose = False    # print every received command
+
+        # line model, only used with timing=True
+        self.timing = timing
+        self.baudrate = baudrate
+        self.byte_time = 10 / baudrate          # start + 8 data + stop bit
+        self.processing_delay = processing_delay
+        self.overrun_tolerance = overrun_tolerance
+        self.overruns = 0
+        self._line = b""                # received bytes of an incomplete command
+        self._line_start = 0.0          # arrival of its first byte
+        self._host_line_free = 0.0      # host -> RIS line idle from
+        self._ris_line_free = 0.0       # RIS -> host line idle from
+        self._busy_until = 0.0          # firmware processes / answers a command until
 
     def write(self, data: bytes):
         with self.lock:
             self._tx_log.append(data)
-            line = data.decode('ascii', errors='ignore').strip().lower()
+            start = max(time.perf_counter(), self._host_line_free)
+            if self.timing:
+                self._host_line_free = start + len(data) * self.byte_time
+            for index, byte in enumerate(data):
+                if not self._line:
+                    self._line_start = start + index * self.byte_time
+                self._line += bytes((byte,))
+                if byte == ord("\n"):
+                    line, self._line = self._line, b""
+                    self._command(line, self._line_start, start + (index + 1) * self.byte_time)
+            return len(data)
+
+    def _command(self, raw: bytes, t_first, t_end):
+        line = raw.decode('ascii', errors='ignore').strip().lower()
+        metrics.count("sim_serial_rx")
+        if self.verbose:
             print(f"[RISSimulator] Received: {line}")
-            if not line:
-                return
-            if not self._booted:
-                return
-
-            if line.startswith("!0x"):
-                try:
-                    hexdata = line[3:]
-                    if len(hexdata) != 64:
-                        raise ValueError("Invalid pattern length")
-                    self.pattern = int(hexdata, 16)
-                    self._enqueue("#OK\n")
-                except ValueError:
-                    pass  # invalid pattern → no response
-            elif line == "?pattern":
-                pattern_hex = f"{self.pattern:064X}"
-                self._enqueue(f"#0X{pattern_hex}\n")
-            elif line == "?vext":
-                self._enqueue(f"#{self.vext:.2f} V\n")
-            elif line == "?serialno":
-                self._enqueue(f"#SerNo:{self.serialno}\n")
-            elif line == "!reset":
-                self._booted = False
-                threading.Timer(0.5, self._boot_ready).start()
-            elif line.startswith("!bt-key"):
-                self.bt_key = line[len("!bt-key"):].strip()
-                self._enqueue("#OK\n")
-            else:
-                pass  # unknown command → no response
+        if not line:
+            return
+        if not self._booted:
+            return
+        if self.timing and t_first < self._busy_until - self.overrun_tolerance:
+            self.overruns += 1      # '!' / '?' while busy: firmware clears its FIFO
+            metrics.count("sim_serial_overrun")
+            return
+        t_reply = t_end + self.processing_delay
+
+        if line.startswith("!0x"):
+            try:
+                self.pattern = int_from_hex(line)
+                self._enqueue("#OK\n", t_reply)
+            except ValueError:
+                pass  # invalid pattern → no response
+        elif line == "?pattern":
+            self._enqueue(reply_from_int(self.pattern).decode(), t_reply)
+        elif line == "?vext":
+            self._enqueue(f"#{self.vext:.2f} V\n", t_reply)
+        elif line == "?serialno":
+            self._enqueue(f"#SerNo:{self.serialno}\n", t_reply)
+        elif line == "!reset":
+            self._booted = False
+            self.pattern = 0        # firmware clears the shift registers on boot
+            threading.Timer(0.5, self._boot_ready).start()
+        elif line.startswith("!bt-key"):
+            self.bt_key = line[len("!bt-key"):].strip()
+            self._enqueue("#OK\n", t_reply)
+        else:
+            pass  # unknown command → no response
 
     def _boot_ready(self):
         self._enqueue("\n")
@@ -60,18 +111,52 @@ class RISSimulatorSerial:
         self._enqueue("#READY!\n")
         self._booted = True
 
-    def _enqueue(self, msg: str):
-        self._rx_queue.put(msg.encode("ascii"))
+    def _enqueue(self, msg: str, t_reply=None):
+        data = msg.encode("ascii")
+        with self.lock:
+            t_ready = 0.0
+            if self.timing:
+                start = max(time.perf_counter() if t_reply is None else t_reply, self._ris_line_free)
+                t_ready = self._ris_line_free = start + len(data) * self.byte_time
+                self._busy_until = t_ready      # the firmware transmits blocking
+            self._deliver(t_ready, data)
+
+    def _deliver(self, t_ready, data: bytes):
+        with self._rx_ready:
+            self._rx.append((t_ready, data))
+            self._rx_ready.notify_all()
 
     def readline(self, timeout=1.0) -> bytes:
-        try:
-            return self._rx_queue.get(timeout=timeout)
-        except:
-            return b""
+        deadline = time.perf_counter() + timeout
+        with self._rx_ready:
+            while True:
+                now = time.perf_counter()
+                if self._rx and self._rx[0][0] <= now:
+                    return self._rx.popleft()[1]
+                if now >= deadline:
+                    return b""
+                wake = min(deadline, self._rx[0][0]) if self._rx else deadline
+                self._rx_ready.wait(wake - now)
+
+    def read_ready(self) -> bytes:
+        # all replies that are readable now (non-blocking), e.g. for RISSimulatorPty
+        with self.lock:
+            data = b""
+            now = time.perf_counter()
+            while self._rx and self._rx[0][0] <= now:
+                data += self._rx.popleft()[1]
+            return data
+
+    def next_ready(self):
+        # time the next reply becomes readable, None if nothing is pending
+        with self.lock:
+            return self._rx[0][0] if self._rx else None
 
     @property
     def in_waiting(self):
-        return self._rx_queue.qsize()
+        with self.lock:
+            now = time.perf_counter()
+            return sum(len(data) for t_ready, data in self._rx if t_ready <= now)
 
     def close(self):
         self._closed = True
@@ -80,4 +165,116 @@ class RISSimulatorSerial:
         return not self._closed
 
     def get_tx_log(self):
-        return self._tx_log
\ No newline at end of file
+        return self._tx_log
+
+    def __getstate__(self):
+        # copy for RISSimulatorPty(process=True): without locks, pending replies are dropped
+        state = self.__dict__.copy()
+        for name in ("lock", "_rx_ready", "_rx"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rx = deque()
+        self.lock = threading.RLock()
+        self._rx_ready = threading.Condition(self.lock)
+
+
+def _serve_pty(sim, port, stop):
+    # opens the pty itself (also in a spawned process) and serves it until stop is set
+    import tty
+    import select
+    master, slave = os.openpty()
+    tty.setraw(slave)       # no echo / newline translation
+    port.send(os.ttyname(slave))
+    try:
+        while not stop.is_set():
+            t_next = sim.next_ready()
+            wait = 0.05 if t_next is None else min(0.05, max(0.0, t_next - time.perf_counter()))
+            readable, _, _ = select.select([master], [], [], wait)
+            if readable:
+                sim.write(os.read(master, 4096))
+            data = sim.read_ready()
+            if data:
+                os.write(master, data)
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+class RISSimulatorPty:
+    """
+    Stellt einen RISSimulatorSerial hinter einem Pseudo-Terminal bereit (nur Linux / macOS),
+    so dass unveraenderter pyserial-Code (RISinterface mit Portname) mit ihm spricht:
+        if __name__ == "__main__":      # noetig mit process=True (spawn)
+            with RISSimulatorPty() as port:
+                interface.setPort(port)
+    Standard ist der Simulator mit timing=True, die Baudrate des pty selbst ist wirkungslos.
+    process=True bedient das pty aus einem eigenen Prozess wie ein echtes Geraet, sonst
+    verzoegert der GIL des Hosts (busy wait) den Empfang und verfaelscht das Timing. Der Prozess
+    wird per spawn gestartet (fork nach numba-Threads blockiert den Host beim Beenden) und
+    arbeitet auf einer Kopie des Simulators; das aufrufende Skript braucht deshalb den Schutz
+    if __name__ == "__main__":, sonst fuehrt der Prozess es erneut aus. Mit process=False laeuft ein Thread und der Zustand
+    (sim.pattern, ...) bleibt abfragbar.
+    Empfangszeit ist der Zeitpunkt des Lesens aus dem pty, Scheduling-Verzoegerung verschiebt sie
+    um einige ms; der Standard-Simulator toleriert daher 5 ms bei der overrun-Erkennung (exakt
+    prueft nur RISSimulatorSerial(timing=True) im selben Prozess).
+    """
+    def __init__(self, simulator=None, process=True):
+        self.sim = simulator if simulator is not None else RISSimulatorSerial(timing=True, overrun_tolerance=5e-3)
+        self.process = process
+        self.port = None
+        self._worker = None
+        self._stop = None
+
+    def start(self, timeout=30.0) -> str:
+        import multiprocessing
+        if self.process:
+            context = multiprocessing.get_context("spawn")
+            self._stop = context.Event()
+            parent, child = context.Pipe()
+            self._worker = context.Process(target=_serve_pty, args=(self.sim, child, self._stop),
+                                           name="RISSimulatorPty", daemon=True)
+        else:
+            self._stop = threading.Event()
+            parent, child = multiprocessing.Pipe()
+            self._worker = threading.Thread(target=_serve_pty, args=(self.sim, child, self._stop),
+                                            name="RISSimulatorPty", daemon=True)
+        self.port = None
+        self._worker.start()
+        if self.process:
+            child.close()       # only the process holds it, a dead process closes the pipe
+        deadline = time.perf_counter() + timeout
+        try:
+            while not parent.poll(0.05):
+                if not self._worker.is_alive() or time.perf_counter() > deadline:
+                    break
+            else:
+                self.port = parent.recv()
+        except EOFError:        # process exits, its pipe end is closed
+            self._worker.join(5.0)
+        finally:
+            parent.close()
+        if self.port is None:
+            if self._worker.is_alive():
+                self.stop()
+                raise OSError(f"pty simulator did not start within {timeout} s")
+            self._worker.join()
+            exitcode = getattr(self._worker, "exitcode", None)
+            self._worker = None
+            raise OSError(f"pty simulator exited during start (exit code {exitcode}), "
+                          "missing if __name__ == \"__main__\": guard in the calling script?")
+        return self.port
+
+    def stop(self):
+        if self._worker is not None:
+            self._stop.set()
+            self._worker.join()
+        self._worker = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,5 +1,5 @@
 import sys
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtWidgets import QMainWindow, QDockWidget, QApplication, QLabel, QVBoxLayout, QWidget
 
 
@@ -7,10 +7,12 @@ try:    # import if main.py is executed
     from .Toggletable import ToggleTable
     from .RIScontroller import RIScontroller
     from .rissimulator_ui import RISsimulator_ui
+    from .metrics import metrics
 except ImportError:     # import if mainwindow.py is executed
     from lib.Toggletable import ToggleTable
     from lib.RIScontroller import RIScontroller
     from lib.rissimulator_ui import RISsimulator_ui
+    from lib.metrics import metrics
 
 
 class MainWindow(QMainWindow):
@@ -67,6 +69,19 @@ class MainWindow(QMainWindow):
         # add menu with "Quit"
         self.menuBar().addMenu('File').addAction('Quit', self.close)
 
+        # optional performance overlay (enables metrics collection while shown)
+        self.metrics_overlay = QLabel(self.centre)
+        self.metrics_overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 170); color: white; font-family: monospace; padding: 4px;")
+        self.metrics_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.metrics_overlay.hide()
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(500)
+        self.metrics_timer.timeout.connect(self.update_metrics_overlay)
+        overlay_action = self.menuBar().addMenu('View').addAction('Performance overlay')
+        overlay_action.setCheckable(True)
+        overlay_action.toggled.connect(self.show_metrics_overlay)
+
         # init statusbar
         self.statbar = self.statusBar()
         self.statbarMsgtime = 3000
@@ -85,10 +100,31 @@ class MainWindow(QMainWindow):
         self.setStatusBar(self.statbar)
         self.toggletable.setStatusBarObject(self.statbar)
 
+        # calculated beam steering patterns are applied like table edits
+        self.ris_siumulator_ui.pattern_synthesized.connect(self.toggletable.set_state_matrix)
+
     def set_RISmask(self, mask):
-        self.ris_controller.interface.set_pattern(mask)
+        if self.ris_controller.interface.connected:
+            self.ris_controller.interface.set_pattern(mask)
         self.ris_siumulator_ui.set_mask_bool(mask)
 
+    def show_metrics_overlay(self, show):
+        metrics.enable(show)
+        if show:
+            metrics.reset()
+            self.update_metrics_overlay()
+            self.metrics_overlay.show()
+            self.metrics_overlay.raise_()
+            self.metrics_timer.start()
+        else:
+            self.metrics_timer.stop()
+            self.metrics_overlay.hide()
+
+    def update_metrics_overlay(self):
+        self.metrics_overlay.setText(metrics.summary())
+        self.metrics_overlay.adjustSize()
+        self.metrics_overlay.raise_()
+
     # TODO: dockwidget einfügen per funktion -> mehr übersicht -> weniger code doppelt
     # def add_dock(self, main_widget, dock_content, name):
     #     dock = QDockWidget(name, main_widget)
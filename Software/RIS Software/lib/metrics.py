@@ -0,0 +1,138 @@
+import math
+import bisect
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+# latency histogram buckets: 1 us ... 10 s, 4 buckets per decade (upper bounds in s)
+BUCKETS = [10 ** (exp / 4) for exp in range(-24, 5)]
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)     # last bucket: > BUCKETS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        # upper bound of the bucket that contains the q-quantile
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": list(zip(BUCKETS + [math.inf], self.counts)),
+        }
+
+
+class Metrics:
+    """
+    Timer (Latenz-Histogramme) und Zaehler fuer die Hot Paths. Standardmaessig aus, dann
+    kostet timer() nur einen Attributzugriff. Abfrage per snapshot() bzw. summary().
+        metrics.enable()
+        with metrics.timer("af"):
+            ...
+        metrics.count("serial_errors")
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self._null = nullcontext()
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+
+    def timer(self, name):
+        if not self.enabled:
+            return self._null
+        return self._timer(name)
+
+
+    @contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram()
+            histogram.add(seconds)
+
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def reset(self):
+        with self.lock:
+            self.timers.clear()
+            self.counters.clear()
+
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "timers": {name: hist.as_dict() for name, hist in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+
+    def summary(self) -> str:
+        # human readable table, e.g. for the overlay in MainWindow
+        snap = self.snapshot()
+        lines = ["{:<18}{:>7}{:>10}{:>10}{:>10}".format("stage", "n", "mean ms", "p99 ms", "max ms")]
+        for name, t in sorted(snap["timers"].items()):
+            lines.append("{:<18}{:>7}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                name, t["count"], t["mean"] * 1e3, t["p99"] * 1e3, t["max"] * 1e3))
+        for name, n in sorted(snap["counters"].items()):
+            lines.append("{:<18}{:>7}".format(name, n))
+        return "\n".join(lines)
+
+
+# shared instance for the whole application
+metrics = Metrics()
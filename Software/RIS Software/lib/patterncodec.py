@@ -0,0 +1,115 @@
+import numpy as np
+
+
+# Codierung der Muster (siehe README): Element 1 (oben links, Leserichtung) = MSB (Bit 255).
+# Alle Funktionen arbeiten auf Stapeln, einzelne Muster sind Stapel der Laenge 1:
+#   masks  (K, rows, cols) 0/1        <-> packed (K, 32) uint8, np.packbits, MSB zuerst
+#   packed                            <-> 256 bit ints (Python int)
+#   packed                            <-> "!0x..." Befehle / "#0X..." Antworten (64 Hex-Ziffern)
+ROWS, COLS = 16, 16
+
+_HEX_LOWER = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_HEX_UPPER = np.frombuffer(b"0123456789ABCDEF", dtype=np.uint8)
+_NIBBLE = np.full(256, 255, dtype=np.uint8)       # ascii -> value, 255 = no hex digit
+_NIBBLE[_HEX_LOWER] = np.arange(16)
+_NIBBLE[_HEX_UPPER] = np.arange(16)
+
+
+def pack(masks, rows=ROWS, cols=COLS) -> np.ndarray:
+    # (rows, cols) or (K, rows, cols), every non-zero value is an active element
+    masks = np.asarray(masks)
+    if masks.shape[-2:] != (rows, cols) or masks.ndim not in (2, 3):
+        raise ValueError(f"expected masks of shape (K, {rows}, {cols}), got {masks.shape}")
+    bits = masks.reshape((-1, rows * cols)) != 0
+    return np.packbits(bits, axis=1, bitorder="big")
+
+
+def unpack(packed, rows=ROWS, cols=COLS) -> np.ndarray:
+    # (K, n_bytes) or (n_bytes,) -> (K, rows, cols) uint8
+    packed = np.atleast_2d(np.asarray(packed, dtype=np.uint8))
+    bits = np.unpackbits(packed, axis=1, count=rows * cols, bitorder="big")
+    return bits.reshape((-1, rows, cols))
+
+
+def ints_from_packed(packed) -> list[int]:
+    packed = np.atleast_2d(np.asarray(packed, dtype=np.uint8))
+    data, n = packed.tobytes(), packed.shape[1]
+    return [int.from_bytes(data[i:i + n], "big") for i in range(0, len(data), n)]
+
+
+def packed_from_ints(ints, n_bytes=ROWS * COLS // 8) -> np.ndarray:
+    data = b"".join(int(bit_int).to_bytes(n_bytes, "big") for bit_int in ints)
+    return np.frombuffer(data, dtype=np.uint8).reshape((-1, n_bytes))
+
+
+def _wire(packed, prefix: bytes, digits) -> list[bytes]:
+    packed = np.atleast_2d(np.asarray(packed, dtype=np.uint8))
+    n_chars = len(prefix) + 2 * packed.shape[1] + 1
+    out = np.empty((len(packed), n_chars), dtype=np.uint8)
+    out[:, :len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+    out[:, len(prefix):-1:2] = digits[packed >> 4]
+    out[:, len(prefix) + 1:-1:2] = digits[packed & 0x0F]
+    out[:, -1] = ord("\n")
+    data = out.tobytes()
+    return [data[i:i + n_chars] for i in range(0, len(data), n_chars)]
+
+
+def commands_from_packed(packed) -> list[bytes]:
+    # set pattern commands b"!0x<64 hex>\n"
+    return _wire(packed, b"!0x", _HEX_LOWER)
+
+
+def replies_from_packed(packed) -> list[bytes]:
+    # ?Pattern replies of the firmware b"#0X<64 HEX>\n"
+    return _wire(packed, b"#0X", _HEX_UPPER)
+
+
+def packed_from_hex(lines, n_bytes=ROWS * COLS // 8) -> np.ndarray:
+    """
+    Hex-Muster (str oder bytes, einzeln oder als Liste) -> (K, n_bytes) uint8.
+    Erlaubt sind "!0x..." Befehle, "#0X..." Antworten und reine Hex-Ziffern, jeweils mit oder
+    ohne Zeilenende. ValueError bei falscher Laenge oder ungueltigen Zeichen.
+    """
+    if isinstance(lines, (str, bytes)):
+        lines = [lines]
+    digits = []
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode("ascii", errors="replace")
+        line = line.strip()
+        if line[:3] in (b"!0x", b"!0X", b"#0x", b"#0X"):
+            line = line[3:]
+        if len(line) != 2 * n_bytes:
+            raise ValueError(f"expected {2 * n_bytes} hex digits, got {len(line)}")
+        digits.append(line)
+    nibbles = _NIBBLE[np.frombuffer(b"".join(digits), dtype=np.uint8)].reshape((-1, 2 * n_bytes))
+    if (nibbles == 255).any():
+        raise ValueError("invalid hex digit in pattern")
+    return (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+
+
+def encode_commands(masks, rows=ROWS, cols=COLS) -> list[bytes]:
+    return commands_from_packed(pack(masks, rows, cols))
+
+
+def decode_masks(lines, rows=ROWS, cols=COLS) -> np.ndarray:
+    return unpack(packed_from_hex(lines, rows * cols // 8), rows, cols)
+
+
+# single patterns, used per command by RISinterface and the simulator
+def pattern_int(state_matrix) -> int:
+    # 256 bit number of a 16 x 16 pattern, element 1 = MSB
+    return int.from_bytes(pack(state_matrix)[0].tobytes(), "big")
+
+
+def command_from_int(bit_int) -> bytes:
+    return f"!{bit_int:#0{66}x}\n".encode()
+
+
+def reply_from_int(bit_int) -> bytes:
+    return f"#0X{bit_int:064X}\n".encode()
+
+
+def int_from_hex(hex_str) -> int:
+    # 64 hex digits, optionally "!0x" / "#0X" and line end; ValueError otherwise
+    return ints_from_packed(packed_from_hex(hex_str))[0]
@@ -0,0 +1,149 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.RISinterface import RISinterface
+from lib.metrics import metrics
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class RISpool:
+    """
+    Mehrere RIS-Boards, identifiziert ueber ?SerialNo. Muster werden je Geraet oder an alle
+    (broadcast) parallel aus einem Thread-Pool gesendet, die Latenz ist damit die des
+    langsamsten Geraets statt der Summe. health() liefert den Zustand je Geraet.
+    devices: Portnamen oder bereits erzeugte RISinterface, "DEMO:<Seriennummer>" fuer simulierte
+    Boards (z.B. ["DEMO:1", "DEMO:2"]).
+        pool = RISpool(["COM3", "COM4"])
+        pool.connect()
+        pool.broadcast(mask)
+        pool.set_patterns({12: mask_a, 13: mask_b})
+    """
+    def __init__(self, devices, unhealthy_after=3):
+        self.interfaces = []
+        for device in devices:
+            if isinstance(device, RISinterface):
+                self.interfaces.append(device)
+            else:
+                interface = RISinterface()
+                interface.setPort(device)
+                self.interfaces.append(interface)
+        self.unhealthy_after = unhealthy_after      # consecutive errors until a device is unhealthy
+        self.devices = {}           # serial number -> device state (dict)
+        self.executor = None
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def connect(self) -> tuple[bool, str]:
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.interfaces)),
+                                           thread_name_prefix="RISpool")
+        results = list(self.executor.map(self._open, self.interfaces))
+        failed = [str(interface.Port) for interface, serialno in zip(self.interfaces, results)
+                  if serialno is None]
+
+        self.devices = {}
+        for interface, serialno in zip(self.interfaces, results):
+            if serialno is None:
+                continue
+            if serialno in self.devices:
+                failed.append(f"{interface.Port} (serial number {serialno} already in pool)")
+                continue
+            self.devices[serialno] = {
+                "interface": interface, "port": interface.Port, "lock": threading.Lock(),
+                "patterns_set": 0, "errors": 0, "consecutive_errors": 0,
+                "last_ok": None, "last_latency": None,
+            }
+        if failed:
+            return (False, "connection failed: " + ", ".join(failed))
+        return (True, f"{len(self.devices)} RIS connected: {sorted(self.devices)}")
+
+
+    def _open(self, interface):
+        # connect and read the serial number, None if the board does not answer
+        try:
+            if not interface.connect()[0]:
+                return None
+            result, text = interface.get_serialnumber()
+        except Exception:
+            return None
+        return parse_serialnumber(text) if result else None
+
+
+    def disconnect(self) -> tuple[bool, str]:
+        for interface in self.interfaces:
+            if interface.connected:
+                interface.disconnect()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.devices = {}
+        return (True, "RIS pool disconnected")
+
+
+    def serialnumbers(self) -> list[int]:
+        return sorted(self.devices)
+
+
+#### pattern fan-out ##############################################################################
+    def set_pattern(self, serialno, state_matrix) -> bool:
+        return self._set_pattern(self.devices[serialno], state_matrix)
+
+
+    def set_patterns(self, patterns: dict) -> dict:
+        # {serial number: pattern}, all devices in parallel, returns {serial number: success}
+        with metrics.timer("pool_fanout"):
+            futures = {serialno: self.executor.submit(self._set_pattern, self.devices[serialno], pattern)
+                       for serialno, pattern in patterns.items()}
+            return {serialno: future.result() for serialno, future in futures.items()}
+
+
+    def broadcast(self, state_matrix) -> dict:
+        return self.set_patterns({serialno: state_matrix for serialno in self.devices})
+
+
+    def _set_pattern(self, device, state_matrix) -> bool:
+        with device["lock"]:        # one command at a time per port
+            start = time.perf_counter()
+            try:
+                result = device["interface"].set_pattern(state_matrix)
+            except Exception:
+                result = False
+            device["last_latency"] = time.perf_counter() - start
+            if result:
+                device["patterns_set"] += 1
+                device["consecutive_errors"] = 0
+                device["last_ok"] = time.time()
+            else:
+                device["errors"] += 1
+                device["consecutive_errors"] += 1
+        return result
+
+
+#### device health ################################################################################
+    def health(self) -> dict:
+        report = {}
+        for serialno, device in self.devices.items():
+            report[serialno] = {
+                "port": device["port"],
+                "connected": device["interface"].connected,
+                "healthy": (device["interface"].connected
+                            and device["consecutive_errors"] < self.unhealthy_after),
+                "patterns_set": device["patterns_set"],
+                "errors": device["errors"],
+                "consecutive_errors": device["consecutive_errors"],
+                "last_ok": device["last_ok"],
+                "last_latency": device["last_latency"],
+            }
+        return report
+
+
+def parse_serialnumber(text) -> int | None:
+    # "#SerNo:  12" -> 12
+    try:
+        return int(text.split(":", 1)[1])
+    except (IndexError, ValueError):
+        return None
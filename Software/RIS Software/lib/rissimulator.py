@@ -1,10 +1,137 @@
 import numpy as np
-from datetime import datetime
+from contextlib import contextmanager
 
-import numexpr as ne
+try:    # import as package (lib.rissimulator)
+    from .steeringcache import SteeringCache
+    from .metrics import metrics
+except ImportError:     # import if rissimulator.py is executed
+    from steeringcache import SteeringCache
+    from metrics import metrics
 
 c = 3e8
 
+# available array factor engines:
+#   "tensor": reference, sums the full M x N x R x R phase tensor
+#   "matrix": factorized, AF = sum_m row_steer[m] * (W @ col_steer)[m] (BLAS, no 4-D tensor)
+#   "numba":  compiled parallel kernel, one thread block per observation direction
+ENGINES = ("tensor", "matrix", "numba")
+
+# sampling of the observation hemisphere:
+#   "grid":  R x R meshgrid over theta in [0, pi/2] and phi in [0, 2pi] (dense near the zenith)
+#   "rings": R theta rings, the phi count per ring shrinks with sin(theta), flat P (~0.64 R*R)
+SAMPLINGS = ("grid", "rings")
+
+
+def ring_counts(resolution):
+    """
+    theta der Ringe und Anzahl phi-Punkte je Ring fuer sampling="rings". Der Abstand auf einem
+    Ring ist hoechstens der phi-Schritt des Grids am Horizont, der Zenit ist ein einzelner Punkt,
+    alle weiteren Ringe haben mindestens 3 Punkte (geschlossene Dreiecksnetze, siehe ring_faces).
+    """
+    theta = np.linspace(0, np.pi/2, resolution)
+    counts = np.maximum(3, np.ceil((resolution - 1) * np.sin(theta) - 1e-9).astype(int))
+    counts[0] = 1
+    return theta, counts
+
+
+def ring_faces(counts):
+    """
+    Triangulierung fuer sampling="rings": benachbarte Ringe (n_a, n_b Punkte, geschlossen) werden
+    nach ihrem phi-Anteil zusammengefuehrt, jeder Schritt auf einem Ring ergibt ein Dreieck.
+    Nur der erste Ring darf ein einzelner Punkt sein, alle weiteren brauchen mindestens 3
+    (ein Ring aus 2 Punkten ergaebe doppelte Dreiecke mit entgegengesetzter Orientierung).
+    """
+    counts = np.asarray(counts)
+    if (counts[1:] < 3).any():
+        raise ValueError("rings after the first need at least 3 points")
+    starts = np.cumsum(counts) - counts
+    faces = []
+    for off_a, n_a, off_b, n_b in zip(starts[:-1], counts[:-1], starts[1:], counts[1:]):
+        # next point of either ring in order of phi, ties advance the inner ring first
+        t = np.concatenate([np.arange(1, n_a + 1) / n_a, np.arange(1, n_b + 1) / n_b])
+        step_b = np.concatenate([np.zeros(n_a, dtype=bool), np.ones(n_b, dtype=bool)])
+        step_b = step_b[np.lexsort((step_b, t))]
+        i_a = np.cumsum(~step_b) - ~step_b      # current point on ring a before each step
+        i_b = np.cumsum(step_b) - step_b
+        a0, a1 = off_a + i_a % n_a, off_a + (i_a + 1) % n_a
+        b0, b1 = off_b + i_b % n_b, off_b + (i_b + 1) % n_b
+        faces.append(np.stack([a0, np.where(step_b, b1, a1), b0], axis=1))
+    faces = np.vstack(faces)
+    return faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2])]   # no zenith slivers
+
+
+def sample_directions(resolution, sampling="grid"):
+    # observation directions (theta, phi): R x R for "grid", flat P for "rings"
+    if sampling == "grid":
+        return np.meshgrid(np.linspace(0, np.pi/2, resolution), np.linspace(0, 2*np.pi, resolution))
+    if sampling == "rings":
+        ring_theta, counts = ring_counts(resolution)
+        starts = np.cumsum(counts) - counts
+        index = np.arange(counts.sum()) - np.repeat(starts, counts)     # position on the ring
+        return np.repeat(ring_theta, counts), 2*np.pi * index / np.repeat(counts, counts)
+    raise ValueError(f"unknown sampling '{sampling}', available: {SAMPLINGS}")
+
+
+def steering_matrix(k, d, count, w):
+    """
+    exp(j*k*n*d*w) fuer n = 0..count-1 als count x P Matrix (F x count x P wenn k ein array
+    der Laenge F ist). Berechnet als fortlaufendes Produkt der Basis exp(j*k*d*w), dadurch nur
+    P (bzw. F*P) komplexe exp statt count*P. Fehler nach 16 Schritten ~1e-6 (complex64).
+    """
+    k = np.asarray(k, dtype=float)
+    base = np.exp(1j * k[..., np.newaxis] * d * w).astype(np.complex64)   # (F x) P
+    steer = np.empty(base.shape[:-1] + (count, base.shape[-1]), dtype=np.complex64)
+    steer[..., 0, :] = 1
+    for n in range(1, count):
+        np.multiply(steer[..., n-1, :], base, out=steer[..., n, :])
+    return steer
+
+
+_numba_kernel = None
+
+
+def numba_kernel():
+    """
+    Kompiliert den numba-Kernel beim ersten Aufruf. numba wird erst hier importiert (~0.3 s),
+    damit der Import von rissimulator ohne numba-Engine schnell bleibt.
+    """
+    global _numba_kernel
+    if _numba_kernel is not None:
+        return _numba_kernel
+    try:
+        from numba import njit, prange
+    except ImportError:
+        raise ImportError("AF engine 'numba' requires the numba package") from None
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def array_factor_kernel(u, v, k, dx, dy, w_re, w_im, out):
+        """
+        |sum_mn w[m,n] * exp(j*k*(n*dx*u + m*dy*v))| fuer jede Richtung p (prange).
+        Die Phasoren der Zeilen/Spalten werden per Rotation fortgeschrieben, die 256 Beitraege
+        bleiben in Registern, geschrieben wird nur out[p]. Kompilat wird im __pycache__ abgelegt.
+        """
+        M, N = w_re.shape
+        for p in prange(u.size):
+            cx, sx = np.cos(k * dx * u[p]), np.sin(k * dx * u[p])
+            cy, sy = np.cos(k * dy * v[p]), np.sin(k * dy * v[p])
+            acc_re, acc_im = 0.0, 0.0
+            ry_re, ry_im = 1.0, 0.0
+            for m in range(M):
+                row_re, row_im = 0.0, 0.0
+                rx_re, rx_im = 1.0, 0.0
+                for n in range(N):
+                    row_re += w_re[m, n] * rx_re - w_im[m, n] * rx_im
+                    row_im += w_re[m, n] * rx_im + w_im[m, n] * rx_re
+                    rx_re, rx_im = rx_re * cx - rx_im * sx, rx_re * sx + rx_im * cx
+                acc_re += row_re * ry_re - row_im * ry_im
+                acc_im += row_re * ry_im + row_im * ry_re
+                ry_re, ry_im = ry_re * cy - ry_im * sy, ry_re * sy + ry_im * cy
+            out[p] = np.sqrt(acc_re * acc_re + acc_im * acc_im)
+
+    _numba_kernel = array_factor_kernel
+    return _numba_kernel
+
+
 ###################################################################################################
 class RISsimulator():
     def __init__(self):
@@ -22,6 +149,28 @@ class RISsimulator():
 
         self.element_mask = np.ones((self.M, self.N), dtype=bool)  # oder dtype=np.float32
 
+        self.verbose = False        # print every new mask to stdout
+
+        self.engine = "matrix"      # AF engine, see ENGINES (default: factorized matrix product)
+
+        # incremental AF update for few toggled elements (only "matrix" engine)
+        self.AF_complex = None      # complex AF (before abs), flat P
+        self.weights = None         # complex element weights exp(j*mask_phase), M x N
+        self.delta_max_flips = 32   # more toggled elements -> full recalculation
+        self.delta_refresh = 256    # full recalculation after n delta updates (rounding drift)
+        self._delta_count = 0
+
+        # LRU cache of psi / steering matrices per operating point (freq, theta_i, phi_i, resolution, sampling)
+        self.steering_cache = SteeringCache(max_bytes=256 * 2**20)
+
+        # setters only mark results as stale, get_af() recalculates what is needed
+        #   "psi": steering (psi / row_steer, col_steer), "phase": mask_phase,
+        #   "mask": mask changed (delta update possible), "af": full AF recalculation
+        self._stale = {"psi", "phase", "af"}
+        self._update_depth = 0
+        self._af_mask = None        # mask the current AF was calculated with
+
+        self.sampling = "grid"      # observation directions, see SAMPLINGS
         self.resolution = -1
         self.set_resolution(200)    # set resolution of calculation (default: 200)
 
@@ -29,18 +178,13 @@ class RISsimulator():
         self.theta_i = 0.1
         self.phi_i = 0.1
 
-
         self.k = 2 * np.pi * self.freq / c
         self.sin_theta_i = np.sin(self.theta_i)
         self.cos_phi_i = np.cos(self.phi_i)
         self.sin_phi_i = np.sin(self.phi_i)
-        self.psi = self.k * (
-            self.delta_x * (self._sin_theta * self._cos_phi - self.sin_theta_i * self.cos_phi_i) +
-            self.delta_y * (self._sin_theta * self._sin_phi - self.sin_theta_i * self.sin_phi_i)
-        )
 
+        self.mask_bool = np.zeros(shape=(self.M, self.N), dtype=bool)
         self.get_phase_shift(self.freq)
-        self.set_mask_off()
         self.set_freq(5.15e9)       # set frequency (default 5.15GHz)
         self.set_theta_in(0)
         self.set_phi_in(0)
@@ -49,20 +193,50 @@ class RISsimulator():
 ###################################################################################################
     def set_resolution(self, resolution):
         if self.resolution == resolution:
-            return
+            return False
         self.resolution = resolution
+        self.calc_directions()
+        return True
+
 
+    def set_sampling(self, sampling):
+        if sampling not in SAMPLINGS:
+            raise ValueError(f"unknown sampling '{sampling}', available: {SAMPLINGS}")
+        if self.sampling == sampling:
+            return False
+        self.sampling = sampling
+        self.calc_directions()
+        return True
+
+
+    def calc_directions(self):
         # calculate new spherecal coordinates for AF calculation
-        self.theta, self.phi = np.meshgrid(np.linspace(0, np.pi/2, self.resolution), np.linspace(0, 2*np.pi, self.resolution))
-        self._sin_theta = np.sin(self.theta)[np.newaxis, np.newaxis, :, :]
-        self._cos_theta = np.cos(self.theta)[np.newaxis, np.newaxis, :, :]
-        self._cos_phi   = np.cos(self.phi)[np.newaxis, np.newaxis, :, :]
-        self._sin_phi   = np.sin(self.phi)[np.newaxis, np.newaxis, :, :]
+        self.theta, self.phi = sample_directions(self.resolution, self.sampling)
+        shape = (1, 1) + (self.theta.shape if self.theta.ndim == 2 else (1, self.theta.size))
+        self._sin_theta = np.sin(self.theta).reshape(shape)
+        self._cos_theta = np.cos(self.theta).reshape(shape)
+        self._cos_phi   = np.cos(self.phi).reshape(shape)
+        self._sin_phi   = np.sin(self.phi).reshape(shape)
 
         self.sinT_cosP  = np.sin(self.theta) * np.cos(self.phi)
         self.sinT_sinP  = np.sin(self.theta) * np.sin(self.phi)
         self.cosP       = np.cos(self.theta)
 
+        self._stale.update(("psi", "af"))
+
+
+#### select engine for AF calculation #############################################################
+    def set_engine(self, engine):
+        if engine not in ENGINES:
+            raise ValueError(f"unknown AF engine '{engine}', available: {ENGINES}")
+        if engine == "numba":
+            numba_kernel()      # import numba and compile, raises ImportError without numba
+        if self.engine == engine:
+            return False
+        self.engine = engine
+        self._stale.update(("psi", "af"))
+        return True
+
 
 #### set frequency and update depending ###########################################################
     def set_freq(self, freq):
@@ -71,9 +245,7 @@ class RISsimulator():
         self.freq = freq
         self.k = 2 * np.pi * self.freq / c
         self.get_phase_shift(self.freq)
-        self.calc_psi()
-        self.mask_calc_phase()
-        self.array_factor_matrix()
+        self._stale.update(("psi", "phase", "af"))
         return True
 
 
@@ -83,8 +255,7 @@ class RISsimulator():
             return False
         self.theta_i = theta_i
         self.sin_theta_i = np.sin(theta_i)
-        self.calc_psi()
-        self.array_factor_matrix()
+        self._stale.update(("psi", "af"))
         return True
 
 
@@ -94,40 +265,40 @@ class RISsimulator():
         self.phi_i = phi_i
         self.cos_phi_i = np.cos(phi_i)
         self.sin_phi_i = np.sin(phi_i)
-        self.calc_psi()
-        self.array_factor_matrix()
+        self._stale.update(("psi", "af"))
         return True
 
 
 #### mask functions ###############################################################################
     def set_mask_bool(self, mask_bool):
-        if (self.mask_bool == np.array(mask_bool)).all():
+        mask_bool = np.asarray(mask_bool, dtype=bool)
+        if (self.mask_bool == mask_bool).all():
             return False
         self.mask_bool = mask_bool
-        self.mask_print_bool(self.mask_bool)
-        self.mask_calc_phase()
-        self.array_factor_matrix()
+        if self.verbose:
+            self.mask_print_bool(self.mask_bool)
+        self._stale.update(("phase", "mask"))
         return True
 
     def set_mask_rand(self):
-        self.mask_bool = np.random.randint(0, 2, size=(self.M, self.N))
-        self.mask_print_bool(self.mask_bool)
-        self.mask_calc_phase()
-        self.array_factor_matrix()
+        self.mask_bool = np.random.randint(0, 2, size=(self.M, self.N)).astype(bool)
+        if self.verbose:
+            self.mask_print_bool(self.mask_bool)
+        self._stale.update(("phase", "mask"))
         return True
 
     def set_mask_on(self):
-        self.mask_bool = np.ones(shape=(self.M, self.N))
-        self.mask_print_bool(self.mask_bool)
-        self.mask_calc_phase()
-        self.array_factor_matrix()
+        self.mask_bool = np.ones(shape=(self.M, self.N), dtype=bool)
+        if self.verbose:
+            self.mask_print_bool(self.mask_bool)
+        self._stale.update(("phase", "mask"))
         return True
 
     def set_mask_off(self):
-        self.mask_bool = np.zeros(shape=(self.M, self.N))
-        self.mask_print_bool(self.mask_bool)
-        self.mask_calc_phase()
-        self.array_factor_matrix()
+        self.mask_bool = np.zeros(shape=(self.M, self.N), dtype=bool)
+        if self.verbose:
+            self.mask_print_bool(self.mask_bool)
+        self._stale.update(("phase", "mask"))
         return True
 
     def read_phase_file(self, fname):
@@ -137,11 +308,17 @@ class RISsimulator():
 
 
     def get_phase_shift(self, freq):
-        self.phase_off = np.interp(freq, self.phase_shift[:,0], self.phase_shift[:,1])
-        self.phase_on = np.interp(freq, self.phase_shift[:,0], self.phase_shift[:,2])
+        self.phase_off, self.phase_on = self.interp_phase_shift(freq)
         return self.phase_off, self.phase_on
 
 
+    def interp_phase_shift(self, freq):
+        # freq can be a scalar or an array, no state is changed
+        phase_off = np.interp(freq, self.phase_shift[:,0], self.phase_shift[:,1])
+        phase_on = np.interp(freq, self.phase_shift[:,0], self.phase_shift[:,2])
+        return phase_off, phase_on
+
+
 ###################################################################################################
     def mask_print_bool(self, pattern):
         """
@@ -162,37 +339,295 @@ class RISsimulator():
 
 ###################################################################################################
     def calc_psi(self):
-        self.psi = self.k * (
-            self.delta_x * (self._sin_theta * self._cos_phi - self.sin_theta_i * self.cos_phi_i) +
-            self.delta_y * (self._sin_theta * self._sin_phi - self.sin_theta_i * self.sin_phi_i)
-        )
+        key = (self.engine, self.freq, self.theta_i, self.phi_i, self.resolution, self.sampling)
+        entry = self.steering_cache.get(key)
+        metrics.count("psi_cache_hit" if entry is not None else "psi_cache_miss")
+        if entry is None:
+            with metrics.timer("psi"):
+                if self.engine == "tensor":
+                    entry = {"psi": self.k * (
+                        self.delta_x * (self._sin_theta * self._cos_phi - self.sin_theta_i * self.cos_phi_i) +
+                        self.delta_y * (self._sin_theta * self._sin_phi - self.sin_theta_i * self.sin_phi_i)
+                    )}
+                elif self.engine == "numba":
+                    u, v = self.observation_uv()
+                    entry = {"obs_u": u, "obs_v": v}
+                else:
+                    entry = self.calc_steering()
+            self.steering_cache.put(key, entry)
+        for name, value in entry.items():
+            setattr(self, name, value)
+
+
+    def cache_stats(self) -> dict:
+        return self.steering_cache.stats()
+
+
+    def calc_steering(self):
+        """
+        Zerlegt psi = k*(n*dx*u + m*dy*v) in eine Spalten- (N x P) und eine Zeilen-Steuermatrix
+        (M x P) mit P = R*R Beobachtungsrichtungen. Der 4-D Tensor wird nie angelegt.
+        """
+        u, v = self.observation_uv()
+        return {
+            "col_steer": steering_matrix(self.k, self.dx, self.N, u),   # N x P
+            "row_steer": steering_matrix(self.k, self.dy, self.M, v),   # M x P
+        }
+
+
+    def observation_uv(self):
+        # direction cosines of all observation points relative to the specular direction (flat P)
+        u = (self.sinT_cosP - self.sin_theta_i * self.cos_phi_i).ravel()
+        v = (self.sinT_sinP - self.sin_theta_i * self.sin_phi_i).ravel()
+        return u, v
 
 
     def mask_calc_phase(self):
-        temp = np.copy(self.mask_bool)
-        temp[temp==0] = self.phase_off
-        temp[temp==1] = self.phase_on
-        self.mask_phase = np.deg2rad(temp).astype(np.float32)[:, :, np.newaxis, np.newaxis]
+        with metrics.timer("mask_phase"):
+            temp = np.where(self.mask_bool, self.phase_on, self.phase_off)
+            self.mask_phase = np.deg2rad(temp).astype(np.float32)[:, :, np.newaxis, np.newaxis]
 
 
 ###################################################################################################
     def array_factor_matrix(self):
+        self.refresh_inputs()
+
+        with metrics.timer("af"):
+            if self.engine == "tensor":
+                self.AF_complex = None
+                self.AF = self.array_factor_tensor()
+            elif self.engine == "numba":
+                self.AF_complex = None
+                self.AF = self.array_factor_numba()
+            else:
+                self.AF = self.array_factor_product()
+        self._delta_count = 0
+        self._af_mask = self.mask_bool.copy()
+        self._stale.difference_update(("mask", "af"))
+
+        return self.AF
 
-        start = datetime.now()
 
+    def array_factor_tensor(self):
+        import numexpr as ne    # only needed by the reference engine, keeps the import fast
         phase = self.psi + self.mask_phase
         re = ne.evaluate("cos(phase)")
         im = ne.evaluate("sin(phase)")
         af = np.ascontiguousarray(re + 1j * im).astype(np.complex64)
-        self.AF = np.abs(np.einsum('ijkl->kl', af))
-        print("AF calculation time: {:.3f}ms".format((datetime.now()-start).total_seconds()*1000))
+        return np.abs(np.einsum('ijkl->kl', af)).reshape(self.theta.shape)
 
+
+    def array_factor_product(self):
+        self.weights = np.exp(1j * self.mask_phase[:, :, 0, 0]).astype(np.complex64)  # M x N
+        self.AF_complex = np.einsum('mp,mp->p', self.row_steer, self.weights @ self.col_steer)
+        return np.abs(self.AF_complex).reshape(self.theta.shape)
+
+
+    def array_factor_numba(self):
+        phase = self.mask_phase[:, :, 0, 0].astype(np.float64)
+        out = np.empty(self.obs_u.size, dtype=np.float32)
+        numba_kernel()(self.obs_u, self.obs_v, self.k, self.dx, self.dy,
+                       np.cos(phase), np.sin(phase), out)
+        return out.reshape(self.theta.shape)
+
+
+#### incremental update for toggled elements ######################################################
+    def delta_possible(self, n_flipped):
+        return (self.engine == "matrix" and self.AF_complex is not None
+                and n_flipped <= self.delta_max_flips
+                and self._delta_count < self.delta_refresh)
+
+
+    def array_factor_delta(self, flipped):
+        """
+        Rang-k Korrektur des komplexen AF fuer k umgeschaltete Elemente (k x 2 Indizes):
+        AF += sum_i (w_neu - w_alt)_i * row_steer[m_i] * col_steer[n_i], Aufwand O(k*P).
+        """
+        with metrics.timer("af_delta"):
+            rows, cols = flipped[:, 0], flipped[:, 1]
+            new_weights = np.exp(1j * self.mask_phase[rows, cols, 0, 0]).astype(np.complex64)
+            delta_w = new_weights - self.weights[rows, cols]
+            self.AF_complex += np.einsum('kp,kp->p', delta_w[:, np.newaxis] * self.row_steer[rows],
+                                         self.col_steer[cols])
+            self.weights[rows, cols] = new_weights
+            self._delta_count += 1
+            self._af_mask[rows, cols] = self.mask_bool[rows, cols]
+
+            self.AF = np.abs(self.AF_complex).reshape(self.theta.shape)
+        metrics.count("af_delta_elements", len(rows))
+        return self.AF
+
+
+#### wideband frequency sweep #####################################################################
+    def sweep_freq(self, freqs=None, mask_bool=None, max_bytes=256 * 2**20):
+        """
+        AF fuer viele Frequenzen in einem gebatchten Durchlauf, Rueckgabe F x R x R (float32).
+        Default sind alle Frequenzen der Phasendatei und die aktuelle Maske. Der Zustand des
+        Simulators (freq, AF, Cache) bleibt unveraendert. Gerechnet wird in Frequenzbloecken,
+        deren temporaere arrays in max_bytes passen.
+        """
+        freqs = self.phase_shift[:, 0] if freqs is None else np.atleast_1d(np.asarray(freqs, dtype=float))
+        mask_bool = self.mask_bool if mask_bool is None else np.asarray(mask_bool, dtype=bool)
+
+        phase_off, phase_on = self.interp_phase_shift(freqs)
+        phase = np.where(mask_bool, phase_on[:, np.newaxis, np.newaxis], phase_off[:, np.newaxis, np.newaxis])
+        weights = np.exp(1j * np.deg2rad(phase)).astype(np.complex64)   # F x M x N
+        k = 2 * np.pi * freqs / c
+
+        u, v = self.observation_uv()
+        P = u.size
+        bytes_per_freq = (2 * self.M + self.N) * P * 8
+        chunk = max(1, int(max_bytes // bytes_per_freq))
+
+        AF = np.empty((len(freqs), P), dtype=np.float32)
+        for start in range(0, len(freqs), chunk):
+            sl = slice(start, start + chunk)
+            col_steer = steering_matrix(k[sl], self.dx, self.N, u)     # f x N x P
+            row_steer = steering_matrix(k[sl], self.dy, self.M, v)     # f x M x P
+            AF[sl] = np.abs(np.einsum('fmp,fmp->fp', row_steer, weights[sl] @ col_steer))
+        return AF.reshape((len(freqs),) + self.theta.shape)
+
+
+#### batched evaluation of many masks #############################################################
+    def evaluate_masks(self, masks, directions=None, max_bytes=256 * 2**20):
+        """
+        Bewertet K Masken (K x M x N, bool/uint8) bei aktueller Frequenz und Einfallsrichtung
+        ohne den Zustand des Simulators zu aendern.
+        directions=None: volles AF, Rueckgabe K x R x R
+        directions (S x 2, [theta, phi] in rad): nur |AF| in diesen Richtungen, Rueckgabe K x S
+        """
+        masks = np.asarray(masks)
+        if masks.ndim == 2:
+            masks = masks[np.newaxis]
+        if masks.shape[1:] != (self.M, self.N):
+            raise ValueError(f"masks must have shape (K, {self.M}, {self.N}), got {masks.shape}")
+        masks = masks.astype(bool)
+
+        if directions is not None:
+            return self.evaluate_masks_gain(masks, directions)
+
+        w_off, w_on = np.exp(1j * np.deg2rad([self.phase_off, self.phase_on])).astype(np.complex64)
+        if self.engine == "matrix":
+            self.refresh_inputs()
+            col_steer, row_steer = self.col_steer, self.row_steer
+        else:                           # only the matrix engine keeps steering matrices
+            steering = self.calc_steering()
+            col_steer, row_steer = steering["col_steer"], steering["row_steer"]
+        P = col_steer.shape[1]
+
+        chunk = max(1, int(max_bytes // (2 * self.M * P * 8)))
+        AF = np.empty((len(masks), P), dtype=np.float32)
+        for start in range(0, len(masks), chunk):
+            weights = np.where(masks[start:start + chunk], w_on, w_off)              # k x M x N
+            AF[start:start + chunk] = np.abs(np.einsum('mp,kmp->kp', row_steer, weights @ col_steer))
+        return AF.reshape((len(masks),) + self.theta.shape)
+
+
+    def evaluate_masks_gain(self, masks, directions):
+        """
+        |AF| von K Masken in S Richtungen. Mit G[mn, s] = row_steer[m, s] * col_steer[n, s] gilt
+        AF = w_off * sum(G) + (w_on - w_off) * (mask @ G), d.h. zwei float32 GEMMs fuer alle Masken.
+        """
+        directions = np.atleast_2d(np.asarray(directions, dtype=float))
+        col_steer, row_steer = self.direction_steering(directions[:, 0], directions[:, 1])
+        G = (row_steer[:, np.newaxis, :] * col_steer[np.newaxis, :, :]).reshape((self.M * self.N, -1))
+
+        w_off, w_on = np.exp(1j * np.deg2rad([self.phase_off, self.phase_on])).astype(np.complex64)
+        flat = masks.reshape((len(masks), -1)).astype(np.float32)
+        on_sum = (flat @ G.real.astype(np.float32)) + 1j * (flat @ G.imag.astype(np.float32))
+        return np.abs(w_off * G.sum(axis=0) + (w_on - w_off) * on_sum).astype(np.float32)
+
+
+    def direction_steering(self, theta, phi):
+        # column (N x S) and row (M x S) steering matrices for arbitrary directions (rad)
+        theta, phi = np.asarray(theta, dtype=float), np.asarray(phi, dtype=float)
+        u = np.sin(theta) * np.cos(phi) - self.sin_theta_i * self.cos_phi_i
+        v = np.sin(theta) * np.sin(phi) - self.sin_theta_i * self.sin_phi_i
+        return steering_matrix(self.k, self.dx, self.N, u), steering_matrix(self.k, self.dy, self.M, v)
+
+
+#### 1-bit beam steering synthesis ################################################################
+    def synthesize_beam(self, theta_r, phi_r, max_flips=256, n_offsets=16):
+        """
+        1-bit Muster, das bei aktueller Frequenz und Einfallsrichtung nach (theta_r, phi_r) in rad
+        abstrahlt. Start ist der quantisierte Phasengradient (bester von n_offsets globalen
+        Phasenversaetzen), danach gierige Einzel-Element-Flips solange |AF| in Zielrichtung
+        steigt (inkrementell, O(M*N) pro Flip). Rueckgabe: (mask_bool M x N, |AF| in Zielrichtung)
+        """
+        col_steer, row_steer = self.direction_steering([theta_r], [phi_r])
+        G = row_steer[:, np.newaxis, 0].astype(np.complex128) * col_steer[np.newaxis, :, 0]    # M x N
+        w_off, w_on = np.exp(1j * np.deg2rad([self.phase_off, self.phase_on]))
+
+        # quantized phase gradient: each element takes the state closest to the ideal weight
+        alpha = np.linspace(0, 2*np.pi, n_offsets, endpoint=False)[:, np.newaxis, np.newaxis]
+        ideal = np.exp(1j * (alpha - np.angle(G)))                      # n_offsets x M x N
+        masks = np.abs(w_on - ideal) < np.abs(w_off - ideal)
+        sums = (np.where(masks, w_on, w_off) * G).sum(axis=(1, 2))
+        best = np.argmax(np.abs(sums))
+        mask, total = masks[best].copy(), sums[best]
+
+        # greedy refinement with single element flips
+        delta = np.where(mask, w_off - w_on, w_on - w_off) * G          # change of AF per flip
+        for _ in range(max_flips):
+            candidates = np.abs(total + delta)
+            idx = np.unravel_index(np.argmax(candidates), mask.shape)
+            if candidates[idx] <= np.abs(total) * (1 + 1e-9):
+                break
+            total += delta[idx]
+            mask[idx] = not mask[idx]
+            delta[idx] = -delta[idx]
+        return mask, float(np.abs(total))
+
+
+#### lazy recalculation ###########################################################################
+    def refresh_inputs(self):
+        # recalculate stale steering and mask phase (not the AF itself)
+        if "psi" in self._stale:
+            self.calc_psi()
+            self._stale.discard("psi")
+        if "phase" in self._stale:
+            self.mask_calc_phase()
+            self._stale.discard("phase")
+
+
+    def refresh(self):
+        if not self._stale:
+            return self.AF
+        self.refresh_inputs()
+        if "af" in self._stale:
+            return self.array_factor_matrix()
+        if "mask" in self._stale:
+            flipped = np.argwhere(self._af_mask != self.mask_bool)
+            self._stale.discard("mask")
+            if len(flipped) == 0:
+                return self.AF
+            if self.delta_possible(len(flipped)):
+                return self.array_factor_delta(flipped)
+            return self.array_factor_matrix()
         return self.AF
 
 
+    @contextmanager
+    def update(self):
+        """
+        Fasst mehrere Parameteraenderungen zu einer Neuberechnung zusammen:
+            with sim.update():
+                sim.set_freq(5.5e9)
+                sim.set_theta_in(0.2)
+        Das AF wird beim Verlassen des aeussersten Blocks einmal berechnet.
+        """
+        self._update_depth += 1
+        try:
+            yield self
+        finally:
+            self._update_depth -= 1
+        if self._update_depth == 0:
+            self.refresh()
+
+
 ###################################################################################################
     def get_af(self):
-        return self.AF
+        return self.refresh()
 
 
 if __name__ == "__main__":
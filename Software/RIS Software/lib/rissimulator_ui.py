@@ -1,23 +1,78 @@
+import time
 import numpy as np
-from datetime import datetime
+from PySide6.QtCore import Signal, QTimer
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QDoubleSpinBox, QGroupBox, QPushButton
+    QLabel, QDoubleSpinBox, QGroupBox, QPushButton, QCheckBox
 )
 import pyqtgraph as pg
 import pyqtgraph.opengl as gl
 
 try:
-    from rissimulator import RISsimulator
+    from rissimulator import RISsimulator, ring_counts, ring_faces
+    from simworker import SimulationWorker
+    from metrics import metrics
 except:
-    from lib.rissimulator import RISsimulator
+    from lib.rissimulator import RISsimulator, ring_counts, ring_faces
+    from lib.simworker import SimulationWorker
+    from lib.metrics import metrics
+
+
+def colormap_lut():
+    # viridis as float32 RGBA lookup table (256 x 4), build once per view
+    lut = pg.colormap.get('viridis').getLookupTable(0.0, 1.0, 256, alpha=True)
+    return (lut / 255.0).astype(np.float32)
+
+
+def face_index_data(resolution, sampling="grid"):
+    # faces of the sampling grid and the per corner index arrays used to gather face values
+    if sampling == "rings":
+        faces = ring_faces(ring_counts(resolution)[1])
+    else:
+        grid = np.arange(resolution * resolution).reshape((resolution, resolution))
+        a = grid[:-1, :-1]
+        b = grid[:-1, 1:]
+        c = grid[1:, :-1]
+        d = grid[1:, 1:]
+        tri1 = np.stack([a.ravel(), b.ravel(), c.ravel()], axis=1)
+        tri2 = np.stack([b.ravel(), d.ravel(), c.ravel()], axis=1)
+        faces = np.vstack([tri1, tri2])
+    return faces, tuple(np.ascontiguousarray(faces[:, i]) for i in range(3))
 
 
 class RISsimulator_ui(QMainWindow):
+    pattern_synthesized = Signal(object)    # mask_bool (M x N) from synthesize_beam
+
     def __init__(self):
         super().__init__()
 
+        # self.sim holds the parameters (setters are lazy, no AF on the GUI thread),
+        # the AF is calculated by the worker thread and delivered via on_result()
         self.sim = RISsimulator()
+        self.worker = SimulationWorker()
+        self.worker.result_ready.connect(self.on_result)
+        self.worker.error.connect(self.on_error)
+        self.result = None
+        self._t_last_frame = None
+        app = QApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.worker.stop)
+
+        # progressive rendering: coarse preview while parameters change, refine when idle
+        self.progressive = True
+        self.full_resolution = self.sim.resolution
+        self.preview_resolution = 50
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.setInterval(300)     # ms without input until full resolution
+        self.refine_timer.timeout.connect(self.refine)
+
+        # persistent GL items, updated in place; faces / LUT are precomputed
+        self.mesh = None
+        self.mesh_data = None
+        self.arrow = None
+        self.lut = colormap_lut()
+        self._faces_cache = {}      # (resolution, sampling) -> (faces, face corner indices)
 
         # init main widget
         self.setWindowTitle("RIS Beampattern - 3D Mesh mit Ebenenraster")
@@ -40,9 +95,9 @@ class RISsimulator_ui(QMainWindow):
 
         self.add_grid_planes()
 
-        self.gen_faces(self.sim.resolution)
+        self.apply_resolution(self.full_resolution)
 
-        self.plot_beampattern_surface()
+        self.request_update()
 
 
 #### creating configuration panel with buttons ####################################################
@@ -71,8 +126,32 @@ class RISsimulator_ui(QMainWindow):
         self.phi_i_input.setSingleStep(1)
         self.phi_i_input.valueChanged.connect(self.set_phi_i)
 
+        self.theta_r_input = QDoubleSpinBox()
+        self.theta_r_input.setSuffix(" °")
+        self.theta_r_input.setRange(0, 90)
+        self.theta_r_input.setValue(30)
+        self.theta_r_input.setSingleStep(1)
+
+        self.phi_r_input = QDoubleSpinBox()
+        self.phi_r_input.setSuffix(" °")
+        self.phi_r_input.setRange(0, 360)
+        self.phi_r_input.setValue(0)
+        self.phi_r_input.setSingleStep(1)
+
+        synth_btn = QPushButton("Muster berechnen")
+        synth_btn.clicked.connect(self.synthesize_beam)
+        self.synth_label = QLabel("")
+
+        self.progressive_input = QCheckBox("Vorschau beim Ändern")
+        self.progressive_input.setChecked(self.progressive)
+        self.progressive_input.toggled.connect(self.set_progressive)
+
+        self.sampling_input = QCheckBox("Gleichmäßige Abtastung (Ringe)")
+        self.sampling_input.setChecked(self.sim.sampling == "rings")
+        self.sampling_input.toggled.connect(self.set_sampling)
+
         apply_btn = QPushButton("Anwenden")
-        apply_btn.clicked.connect(self.plot_beampattern_surface)
+        apply_btn.clicked.connect(self.request_update)
 
         layout.addWidget(QLabel("Frequenz:"))
         layout.addWidget(self.freq_input)
@@ -80,7 +159,15 @@ class RISsimulator_ui(QMainWindow):
         layout.addWidget(self.theta_i_input)
         layout.addWidget(QLabel("Einfallswinkel Azimut (φi):"))
         layout.addWidget(self.phi_i_input)
+        layout.addWidget(QLabel("Zielrichtung Elevation (θr):"))
+        layout.addWidget(self.theta_r_input)
+        layout.addWidget(QLabel("Zielrichtung Azimut (φr):"))
+        layout.addWidget(self.phi_r_input)
+        layout.addWidget(synth_btn)
+        layout.addWidget(self.synth_label)
         layout.addStretch()
+        layout.addWidget(self.progressive_input)
+        layout.addWidget(self.sampling_input)
         layout.addWidget(apply_btn)
 
         return box
@@ -90,105 +177,172 @@ class RISsimulator_ui(QMainWindow):
 #### setter functions for gui #####################################################################
 
     def set_resolution(self, resolution):
-        if self.sim.set_resolution(resolution): # True if value changed
-            self.faces = self.gen_faces(self.sim.resolution)
+        self.full_resolution = resolution
+        if not self.refine_timer.isActive():    # otherwise applied by refine()
+            self.apply_resolution(resolution)
+            self.request_update()
+
+
+    def set_progressive(self, progressive):
+        self.progressive = progressive
+        if not progressive and self.refine_timer.isActive():
+            self.refine_timer.stop()
+            self.refine()
+
+
+    def set_sampling(self, rings):
+        if self.sim.set_sampling("rings" if rings else "grid"):     # True if value changed
+            self.use_faces(self.sim.resolution, self.sim.sampling)
+            self.request_update()
 
 
     def set_freq(self, freq):
         if self.sim.set_freq(freq*1e9):         # True if value changed
-            self.plot_beampattern_surface()
+            self.parameter_changed()
 
 
     def set_theta_i(self, theta_i):
         if self.sim.set_theta_in(np.deg2rad(theta_i)):      # True if value changed
-            self.plot_beampattern_surface()
+            self.parameter_changed()
 
 
     def set_phi_i(self, phi_i):
         if self.sim.set_phi_in(np.deg2rad(phi_i)):          # True if value changed
-            self.plot_beampattern_surface()
+            self.parameter_changed()
 
 
     def set_mask_bool(self, mask_bool):
         if self.sim.set_mask_bool(mask_bool):     # True if value changed
-            self.plot_beampattern_surface()
+            self.request_update()
+
+
+#### progressive rendering ########################################################################
+    def parameter_changed(self):
+        # show a coarse preview and refine once the input has been idle for refine_timer ms
+        if self.progressive and self.full_resolution > self.preview_resolution:
+            self.apply_resolution(self.preview_resolution)
+            self.refine_timer.start()           # restarts while values keep changing
+        self.request_update()
+
+
+    def refine(self):
+        self.apply_resolution(self.full_resolution)
+        self.request_update()
+
+
+    def apply_resolution(self, resolution):
+        self.sim.set_resolution(resolution)
+        self.use_faces(resolution, self.sim.sampling)
+
+
+    def use_faces(self, resolution, sampling="grid"):
+        key = (resolution, sampling)
+        if key not in self._faces_cache:
+            self._faces_cache[key] = face_index_data(resolution, sampling)
+        self.faces, self.face_idx = self._faces_cache[key]
+
+
+#### background simulation ########################################################################
+    def request_update(self):
+        # hand the current state to the worker, superseded requests are dropped there
+        self.worker.submit(
+            freq=self.sim.freq, theta_i=self.sim.theta_i, phi_i=self.sim.phi_i,
+            mask_bool=self.sim.mask_bool.copy(), resolution=self.sim.resolution,
+            sampling=self.sim.sampling, engine=self.sim.engine)
+
+
+    def on_result(self, result):
+        now = time.perf_counter()
+        metrics.observe("request_latency", now - result.t_submit)
+        if self._t_last_frame is not None:
+            metrics.observe("frame_interval", now - self._t_last_frame)
+        self._t_last_frame = now
+        self.result = result
+        self.plot_beampattern_surface()
+
+
+    def on_error(self, message):
+        # the worker keeps running, the last valid result stays on screen
+        self.statusBar().showMessage(f"Simulation failed: {message}", 5000)
+
+
+#### calculates a beam steering pattern for the target direction ##################################
+    def synthesize_beam(self):
+        theta_r = np.deg2rad(self.theta_r_input.value())
+        phi_r = np.deg2rad(self.phi_r_input.value())
+        mask, gain = self.sim.synthesize_beam(theta_r, phi_r)
+        self.synth_label.setText(f"|AF| = {gain:.1f} / {self.sim.M * self.sim.N}")
+        self.set_mask_bool(mask)
+        self.pattern_synthesized.emit(mask)     # e.g. to ToggleTable and RIS
 
 
 #### adds incident vector to the graphic ##########################################################
     def add_incident_vector(self, theta_i, phi_i):
-        try:
-            self.view.removeItem(self.arrow)
-        except:
-            pass
         r = 1.1  # normierte Länge
         x = r * np.sin(-theta_i) * np.cos(phi_i)
         y = r * np.sin(-theta_i) * np.sin(phi_i)
         z = r * np.cos(-theta_i)
 
         vector = np.array([[0, 0, 0], [x, y, z]])
-        self.arrow = gl.GLLinePlotItem(pos=vector, color=("blue"), width=3, antialias=True)
-        self.view.addItem(self.arrow)
+        if self.arrow is None:
+            self.arrow = gl.GLLinePlotItem(pos=vector, color=("blue"), width=3, antialias=True)
+            self.view.addItem(self.arrow)
+        else:
+            self.arrow.setData(pos=vector)
 
 
 ###################################################################################################
-    def gen_faces(self, resolution):
-        grid = np.arange(resolution * resolution).reshape((resolution, resolution))
-        a = grid[:-1, :-1]
-        b = grid[:-1, 1:]
-        c = grid[1:, :-1]
-        d = grid[1:, 1:]
-        tri1 = np.stack([a.ravel(), b.ravel(), c.ravel()], axis=1)
-        tri2 = np.stack([b.ravel(), d.ravel(), c.ravel()], axis=1)
-        self.faces = np.vstack([tri1, tri2])
+    def gen_faces(self, resolution, sampling="grid"):
+        self.faces, self.face_idx = face_index_data(resolution, sampling)
         return self.faces
 
 
-    def gen_vertices(self, AF):
-        AF /= np.max(AF)    # norm to 1
-        X = AF * self.sim.sinT_cosP
-        Y = AF * self.sim.sinT_sinP
-        Z = AF * self.sim.cosP
-        vertices = np.column_stack((X.ravel(), Y.ravel(), Z.ravel()))
+    def gen_vertices(self, AF, grid=None):
+        # AF normed to 1, the array is not modified
+        grid = self.sim if grid is None else grid   # object with sinT_cosP, sinT_sinP, cosP
+        af_r = AF.ravel()
+        vertices = np.empty((af_r.size, 3), dtype=np.float32)
+        np.multiply(af_r, grid.sinT_cosP.ravel(), out=vertices[:, 0])
+        np.multiply(af_r, grid.sinT_sinP.ravel(), out=vertices[:, 1])
+        np.multiply(af_r, grid.cosP.ravel(), out=vertices[:, 2])
         return vertices
 
 
     def gen_colors_face(self, AF):
+        # AF normed to 1, returns float32 RGBA per face from the cached LUT
         af_r = AF.ravel()
-        af_for_faces = (af_r[self.faces[:, 0]] + af_r[self.faces[:, 1]] + af_r[self.faces[:, 2]]) / 3
-
-        lut = pg.colormap.get('viridis').getLookupTable(0.0, 1.0, 256).astype(np.uint8)
-        color_idx = np.clip((af_for_faces * 255).astype(int), 0, 255)
-        color_rgba = lut[color_idx] / 255.0     # shape (n_faces, 3) or (n_faces, 4)
-
-        # Alpha ergänzen um error zu vermeiden
-        if color_rgba.shape[1] == 3:
-            alpha = np.ones((color_rgba.shape[0], 1))
-            faces_colors = np.hstack((color_rgba, alpha))
-        return faces_colors
+        i0, i1, i2 = self.face_idx
+        af_for_faces = (af_r[i0] + af_r[i1] + af_r[i2]) * (255 / 3)
+        color_idx = np.clip(af_for_faces.astype(np.intp), 0, 255)
+        return self.lut[color_idx]
 
 
 ###################################################################################################
     def plot_beampattern_surface(self):
-        # TODO: nur beamplot und eventuell vector löschen
-        try:
-            self.view.removeItem(self.mesh)
-        except:
-            pass
-        # self.add_grid_planes()
-        self.add_incident_vector(self.sim.theta_i, self.sim.phi_i)
-
-        AF = self.sim.get_af()
-        vertices = self.gen_vertices(AF)
-        faces_colors = self.gen_colors_face(AF)
-
-        self.mesh = gl.GLMeshItem(
-            vertexes=vertices,
-            faces=self.faces,
-            faceColors=faces_colors.astype(np.float32),
-            smooth=False,
-            drawEdges=False
-        )
-        self.view.addItem(self.mesh)
+        # draws the latest result of the worker
+        result = self.result
+        if result is None:
+            return
+        self.add_incident_vector(result.theta_i, result.phi_i)
+
+        AF = result.AF / np.max(result.AF)    # norm to 1
+        self.use_faces(result.resolution, result.sampling)
+        with metrics.timer("vertices"):
+            vertices = self.gen_vertices(AF, result)
+        with metrics.timer("colors"):
+            faces_colors = self.gen_colors_face(AF)
+
+        with metrics.timer("gl_upload"):
+            if self.mesh is None:
+                self.mesh_data = gl.MeshData(vertexes=vertices, faces=self.faces, faceColors=faces_colors)
+                self.mesh = gl.GLMeshItem(meshdata=self.mesh_data, smooth=False, drawEdges=False)
+                self.view.addItem(self.mesh)
+            else:       # keep the item, only replace its buffers
+                if self.mesh_data.faces() is not self.faces:
+                    self.mesh_data.setFaces(self.faces)
+                self.mesh_data.setVertexes(vertices)
+                self.mesh_data.setFaceColors(faces_colors)
+                self.mesh.meshDataChanged()
 
 
 #### adds mesh like planes to the plot ############################################################
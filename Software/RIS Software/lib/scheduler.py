@@ -0,0 +1,262 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from lib.metrics import metrics, Histogram
+from lib.patterncodec import pattern_int, command_from_int
+
+
+def reply_kind(line: bytes):
+    # which command a firmware reply belongs to: "ok", "pattern", "vext", "serialno" or None
+    text = line.decode("ascii", errors="replace").strip()
+    if text == "#OK":
+        return "ok"
+    if text.startswith("#0X"):
+        return "pattern"
+    if text.startswith("#SerNo"):
+        return "serialno"
+    if text.startswith("#") and text.endswith(" V"):
+        return "vext"
+    return None
+
+
+def parse_voltage(line) -> float:
+    # "#5.00 V" -> 5.0, nan if not readable
+    if isinstance(line, bytes):
+        line = line.decode("ascii", errors="replace")
+    try:
+        return float(line.strip().lstrip("#").split()[0])
+    except (ValueError, IndexError):
+        return np.nan
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class CommandScheduler:
+    """
+    Besitzt den seriellen Port eines verbundenen RISinterface: ein eigener Thread fuehrt alle
+    Befehle aus, immer nur einer ist unterwegs (die Firmware verwirft Befehle, waehrend sie
+    antwortet). Reihenfolge: Muster vor Abfragen (get_pattern, ...) vor Telemetrie. ?Vext wird
+    alle telemetry_interval s gesendet, aber nur wenn nichts wartet und die Leitung seit
+    idle_gap s frei ist, Musterfolgen werden also nicht unterbrochen (folgen Muster dichter als
+    idle_gap, ruht die Telemetrie; ein kleineres idle_gap nutzt auch kurze Luecken).
+    Antworten werden nach ihrer Form zugeordnet (#OK, #0X..., "#x.xx V"): eine verspaetete
+    Vext-Antwort landet noch im Ringpuffer, statt als Quittung eines Musters zu gelten.
+    Spannungen stehen in einem Ringpuffer mit history Eintraegen und Zeitstempel (time.time).
+        scheduler = CommandScheduler(interface)
+        scheduler.start()
+        scheduler.set_pattern(mask)
+        t, volts = scheduler.voltages()
+    Solange der Scheduler laeuft, darf das interface nicht direkt benutzt werden. Kommt ein
+    Muster waehrend einer laufenden ?Vext-Abfrage, wartet es deren Antwort ab (~1.5 ms bei
+    115200 Bd); wie oft das passiert, zaehlt stats()["delayed_by_telemetry"].
+    """
+    def __init__(self, interface, telemetry_interval=1.0, idle_gap=50e-3, history=3600, timeout=None):
+        self.interface = interface
+        self.telemetry_interval = telemetry_interval    # s between ?Vext, None: no telemetry
+        self.idle_gap = idle_gap        # s without traffic before a telemetry query may start
+        self.timeout = timeout if timeout is not None else interface.timeout
+
+        self.history = history
+        self._volt_time = np.full(history, np.nan)
+        self._volt = np.full(history, np.nan)
+        self._n_samples = 0
+        self.lock = threading.Lock()    # ring buffer and statistics
+
+        self._patterns = deque()        # (bit_int, command, future, submit time)
+        self._queries = deque()         # (command, reply kind, future)
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._in_telemetry = False
+        self._line_free = 0.0           # perf_counter of the end of the last exchange
+        self.thread = None
+
+        self.latency = Histogram()      # submit -> #OK of pattern writes in s
+        self.counters = {"patterns_set": 0, "pattern_errors": 0, "patterns_skipped": 0,
+                         "telemetry_sent": 0, "telemetry_missed": 0, "delayed_by_telemetry": 0,
+                         "stale_replies": 0}
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            raise RuntimeError("scheduler is already running")
+        self._stop.clear()
+        self._line_free = time.perf_counter()     # first ?Vext after idle_gap, not amid a startup burst
+        self.thread = threading.Thread(target=self._run, name="CommandScheduler", daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+        while self._patterns:       # not sent, the port belongs to the interface again
+            self._patterns.popleft()[2].cancel()
+        while self._queries:
+            self._queries.popleft()[2].cancel()
+
+
+    def submit_pattern(self, state_matrix) -> Future:
+        # future result: True after #OK (or if the board already shows the pattern)
+        bit_int = pattern_int(state_matrix)
+        future = Future()
+        with self._wake:
+            if self._in_telemetry:
+                self._count("delayed_by_telemetry")
+            self._patterns.append((bit_int, command_from_int(bit_int), future, time.perf_counter()))
+            self._wake.notify()
+        return future
+
+
+    def set_pattern(self, state_matrix, timeout=None) -> bool:
+        return self.submit_pattern(state_matrix).result(timeout)
+
+
+    def query(self, command: bytes, kind) -> Future:
+        # any command with a reply, kind as returned by reply_kind; future result: reply or b""
+        future = Future()
+        with self._wake:
+            self._queries.append((command, kind, future))
+            self._wake.notify()
+        return future
+
+
+    def get_pattern(self, timeout=None) -> tuple[bool, str]:
+        rx_msg = self.query(b"?Pattern\n", "pattern").result(timeout).decode()
+        if rx_msg:
+            return (True, rx_msg.strip()[3:])
+        return (False, "Error: read Pattern failed!")
+
+
+    def voltages(self) -> tuple[np.ndarray, np.ndarray]:
+        # (timestamps, volts) of the buffered samples, oldest first
+        with self.lock:
+            n = min(self._n_samples, self.history)
+            index = (self._n_samples - n + np.arange(n)) % self.history
+            return self._volt_time[index], self._volt[index]
+
+
+    def latest_voltage(self):
+        # (timestamp, volts) or None before the first sample
+        with self.lock:
+            if not self._n_samples:
+                return None
+            index = (self._n_samples - 1) % self.history
+            return float(self._volt_time[index]), float(self._volt[index])
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters, samples=self._n_samples, latency=self.latency.as_dict())
+
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+        metrics.count(f"scheduler_{name}")
+
+
+    def _add_voltage(self, line):
+        with self.lock:
+            index = self._n_samples % self.history
+            self._volt_time[index] = time.time()
+            self._volt[index] = parse_voltage(line)
+            self._n_samples += 1
+
+
+#### scheduler thread #############################################################################
+    def _run(self):
+        next_poll = time.perf_counter()
+        while not self._stop.is_set():
+            pattern = query = None
+            with self._wake:
+                if self._patterns:
+                    pattern = self._patterns.popleft()
+                elif self._queries:
+                    query = self._queries.popleft()
+                else:
+                    wait = None
+                    if self.telemetry_interval:
+                        wait = max(next_poll, self._line_free + self.idle_gap) - time.perf_counter()
+                    if wait is None or wait > 0:
+                        self._wake.wait(wait)
+                        continue
+                    self._in_telemetry = True
+
+            if pattern is not None:
+                self._write_pattern(*pattern)
+            elif query is not None:
+                command, kind, future = query
+                if future.set_running_or_notify_cancel():
+                    future.set_result(self._exchange(command, kind))
+            else:
+                self._poll_voltage()
+                next_poll = max(next_poll + self.telemetry_interval, time.perf_counter())
+
+
+    def _write_pattern(self, bit_int, command, future, t_submit):
+        if not future.set_running_or_notify_cancel():
+            return
+        interface = self.interface
+        if interface.skip_redundant and bit_int == interface.device_pattern:
+            self._count("patterns_skipped")
+            future.set_result(True)
+            return
+        with metrics.timer("serial_roundtrip"):
+            ok = self._exchange(command, "ok") != b""
+        interface.device_pattern = bit_int if ok else None
+        if ok:
+            with self.lock:
+                self.latency.add(time.perf_counter() - t_submit)
+        self._count("patterns_set" if ok else "pattern_errors")
+        future.set_result(ok)
+
+
+    def _poll_voltage(self):
+        self._count("telemetry_sent")
+        try:
+            line = self._exchange(b"?Vext\n", "vext")
+        finally:
+            with self._wake:
+                self._in_telemetry = False
+        if line:
+            self._add_voltage(line)
+        else:
+            self._count("telemetry_missed")
+
+
+    def _exchange(self, command, kind) -> bytes:
+        # send one command and wait for its reply; replies of other kinds are late answers
+        # to earlier commands: voltages are kept, everything else is dropped
+        deadline = time.perf_counter() + self.timeout
+        try:
+            self.interface.ser.write(command)
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return b""
+                line = self.interface._readline(remaining)
+                if not line:
+                    return b""
+                got = reply_kind(line)
+                if got == kind:
+                    return line
+                if got == "vext":
+                    self._add_voltage(line)
+                else:
+                    self._count("stale_replies")
+        except OSError:     # incl. serial.SerialException, e.g. USB unplugged
+            metrics.count("serial_errors")
+            return b""
+        finally:
+            self._line_free = time.perf_counter()
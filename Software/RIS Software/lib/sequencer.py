@@ -0,0 +1,168 @@
+import os
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+try:    # import as package (lib.sequencer)
+    from .patterncodec import pack, ints_from_packed, commands_from_packed
+    from .metrics import Histogram
+    from .RISinterface import wait_until
+except ImportError:     # import if sequencer.py is executed
+    from patterncodec import pack, ints_from_packed, commands_from_packed
+    from metrics import Histogram
+    from RISinterface import wait_until
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class PatternSequencer:
+    """
+    Setzt Muster zu vorgegebenen Zeitpunkten: schedule = [(t, pattern), ...] mit t in s relativ
+    zu t0 (time.perf_counter, Default: Start + lead). Alle Befehle werden vorab codiert, ein
+    eigener Thread wartet bis kurz vor jede Deadline (sleep), die letzten spin s aktiv, und
+    sendet dann. Hoechstens window Befehle sind ohne #OK unterwegs (die Firmware verwirft einen
+    Befehl, der vor Abarbeitung des vorherigen beginnt, daher Default 1).
+        seq = PatternSequencer(interface)
+        report = seq.run(PatternSequencer.periodic(masks, 2e-3))
+    Der Report enthaelt Sende-/Quittungszeiten, Latenz (Verspaetung) und Jitter als Histogramme.
+    """
+    def __init__(self, interface, window=1, timeout=1.0, spin=1e-3, lead=10e-3, realtime=True):
+        self.interface = interface      # connected RISinterface
+        self.window = window
+        self.timeout = timeout          # s until a missing #OK counts as failed
+        self.spin = spin                # busy wait before each deadline in s
+        self.lead = lead                # default start offset for encoding / thread start
+        self.realtime = realtime        # try SCHED_FIFO for the sequencer thread (Linux, needs rights)
+
+        self.thread = None
+        self.report = None
+        self._stop = threading.Event()
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    @staticmethod
+    def periodic(patterns, interval, start=0.0) -> list:
+        # schedule with a fixed update interval in s
+        return [(start + i * interval, pattern) for i, pattern in enumerate(patterns)]
+
+
+    def run(self, schedule, t0=None) -> dict:
+        self.start(schedule, t0)
+        return self.wait()
+
+
+    def start(self, schedule, t0=None):
+        if self.thread is not None and self.thread.is_alive():
+            raise RuntimeError("sequencer is already running")
+        schedule = sorted(schedule, key=lambda entry: entry[0])
+        packed = pack(np.asarray([pattern for _, pattern in schedule]).reshape((-1, 16, 16)))
+        patterns = ints_from_packed(packed)
+        commands = commands_from_packed(packed)
+        if t0 is None:
+            t0 = time.perf_counter() + self.lead
+        deadlines = t0 + np.array([t for t, _ in schedule], dtype=float)
+
+        self._stop.clear()
+        self.report = None
+        self.thread = threading.Thread(target=self._run, args=(deadlines, commands, patterns),
+                                       name="PatternSequencer", daemon=True)
+        self.thread.start()
+
+
+    def wait(self, timeout=None) -> dict:
+        self.thread.join(timeout)
+        return self.report
+
+
+    def stop(self):
+        # remaining patterns are not sent
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+#### sequencer thread #############################################################################
+    def _run(self, deadlines, commands, patterns):
+        self._set_realtime()
+        n = len(commands)
+        t_send = np.full(n, np.nan)
+        t_ack = np.full(n, np.nan)
+        failed = []
+        pending = deque()       # indices of commands waiting for #OK
+        ser = self.interface.ser
+
+        def read_ack(until):
+            # one reply (or none until time 'until'), matched to the oldest open command
+            now = time.perf_counter()
+            if now - t_send[pending[0]] > self.timeout:
+                failed.append(pending.popleft())
+                return
+            rx_msg = self.interface._readline(max(0.0, min(until, t_send[pending[0]] + self.timeout) - now))
+            if rx_msg:
+                index = pending.popleft()
+                if rx_msg == b"#OK\n":
+                    t_ack[index] = time.perf_counter()
+                else:
+                    failed.append(index)
+
+        sent = 0
+        for index in range(n):
+            if self._stop.is_set():
+                break
+            deadline = deadlines[index]
+            # collect acknowledgements while waiting, block if the window is full
+            while pending and (len(pending) >= self.window or time.perf_counter() < deadline - self.spin):
+                read_ack(deadline - self.spin if len(pending) < self.window else np.inf)
+            wait_until(deadline, self.spin)
+            t_send[index] = time.perf_counter()
+            ser.write(commands[index])
+            pending.append(index)
+            sent += 1
+        while pending:
+            read_ack(np.inf)
+        if sent:    # keep the device state cache of the interface consistent
+            self.interface.device_pattern = patterns[sent - 1] if np.isfinite(t_ack[sent - 1]) else None
+
+        self.report = self._make_report(deadlines[:sent], t_send[:sent], t_ack[:sent], sorted(failed))
+
+
+    def _set_realtime(self):
+        if not self.realtime:
+            return
+        try:        # pid 0 = calling thread on Linux
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+        except (AttributeError, OSError):
+            pass    # no realtime scheduling available, normal priority
+
+
+    @staticmethod
+    def _make_report(deadlines, t_send, t_ack, failed) -> dict:
+        lateness = t_send - deadlines
+        # jitter: deviation of the actual from the scheduled interval between two updates
+        jitter = np.abs(np.diff(t_send) - np.diff(deadlines))
+        roundtrip = t_ack - t_send
+
+        histograms = {}
+        for name, values in (("lateness", lateness), ("jitter", jitter), ("roundtrip", roundtrip)):
+            histograms[name] = Histogram()
+            for value in values[np.isfinite(values)]:
+                histograms[name].add(float(value))
+
+        duration = t_send[-1] - t_send[0] if len(t_send) > 1 else 0.0
+        return {
+            "sent": len(t_send),
+            "ok": int(np.isfinite(t_ack).sum()),
+            "failed": failed,
+            "deadline": deadlines,
+            "t_send": t_send,
+            "t_ack": t_ack,
+            "rate": (len(t_send) - 1) / duration if duration > 0 else 0.0,
+            "lateness": histograms["lateness"].as_dict(),
+            "jitter": histograms["jitter"].as_dict(),
+            "roundtrip": histograms["roundtrip"].as_dict(),
+        }
@@ -0,0 +1,121 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+
+try:    # import as package (lib.simworker)
+    from .rissimulator import RISsimulator
+    from .metrics import metrics
+except ImportError:     # import if simworker.py is executed
+    from rissimulator import RISsimulator
+    from metrics import metrics
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class SimulationWorker(QObject):
+    """
+    Berechnet das AF in einem eigenen QThread mit eigenem RISsimulator.
+    submit() ueberschreibt eine noch nicht begonnene Anfrage (latest wins), es wird also immer
+    nur der zuletzt angeforderte Zustand gerechnet. Ergebnisse kommen per result_ready zurueck,
+    Fehler einer Rechnung per error (die naechste Anfrage wird trotzdem bearbeitet).
+    Zaehler: submitted, computed, dropped (verworfene, ueberholte Anfragen), failed.
+    """
+    result_ready = Signal(object)   # SimpleNamespace: AF, grid arrays and the request state
+    error = Signal(str)             # "<exception type>: <message>" of a failed request
+    _wake = Signal()
+
+    def __init__(self):
+        super().__init__()
+        self.sim = None             # created in the worker thread on first request
+        self.lock = threading.Lock()
+        self._pending = None
+        self._busy = False
+
+        self.submitted = 0
+        self.computed = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self.thread = QThread()
+        self.moveToThread(self.thread)
+        self._wake.connect(self._process)      # queued: runs in self.thread
+        self.thread.start()
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def submit(self, **request):
+        # called from the GUI thread: freq, theta_i, phi_i, mask_bool, resolution, sampling, engine
+        request["t_submit"] = time.perf_counter()
+        with self.lock:
+            if self._pending is not None:
+                self.dropped += 1
+                metrics.count("sim_requests_dropped")
+            self._pending = request
+            self.submitted += 1
+            wake = not self._busy
+            self._busy = True
+        if wake:
+            self._wake.emit()
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"submitted": self.submitted, "computed": self.computed, "dropped": self.dropped,
+                    "failed": self.failed, "busy": self._busy}
+
+
+    def stop(self):
+        self.thread.quit()
+        self.thread.wait()
+
+
+    @Slot()
+    def _process(self):
+        done = False
+        try:
+            while True:
+                with self.lock:
+                    request, self._pending = self._pending, None
+                    if request is None:
+                        self._busy = False      # under the lock: submit() wakes the next run
+                        done = True
+                        return
+                try:
+                    result = self._compute(request)
+                except Exception as error:
+                    with self.lock:
+                        self.failed += 1
+                    metrics.count("sim_worker_errors")
+                    self.error.emit(f"{type(error).__name__}: {error}")
+                    continue
+                with self.lock:
+                    self.computed += 1
+                self.result_ready.emit(result)
+        finally:
+            if not done:        # unexpected exit, the next submit() has to wake the worker again
+                with self.lock:
+                    self._busy = False
+
+
+    def _compute(self, request):
+        if self.sim is None:
+            self.sim = RISsimulator()
+        sim = self.sim
+        with metrics.timer("sim_worker"):
+            with sim.update():
+                sim.set_resolution(request["resolution"])
+                sim.set_sampling(request["sampling"])
+                sim.set_engine(request["engine"])
+                sim.set_freq(request["freq"])
+                sim.set_theta_in(request["theta_i"])
+                sim.set_phi_in(request["phi_i"])
+                sim.set_mask_bool(request["mask_bool"])
+            AF = sim.get_af().copy()    # sim may change it in place (delta update)
+        # grid arrays are replaced (not modified) by set_resolution, sharing them is safe
+        return SimpleNamespace(AF=AF, sinT_cosP=sim.sinT_cosP, sinT_sinP=sim.sinT_sinP, cosP=sim.cosP,
+                               **request)
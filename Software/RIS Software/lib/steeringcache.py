@@ -0,0 +1,84 @@
+from collections import OrderedDict
+import threading
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class SteeringCache:
+    """
+    LRU-Cache fuer Steuertensoren (psi bzw. row_steer/col_steer) eines Betriebspunktes.
+    Eintraege sind dicts mit numpy arrays, die Groesse wird ueber nbytes gegen ein
+    Speicherbudget (in Byte) gerechnet. Gespeicherte arrays duerfen nicht veraendert werden.
+    """
+    def __init__(self, max_bytes=256 * 2**20, max_entries=16):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def get(self, key):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+
+    def put(self, key, entry):
+        nbytes = self._size(entry)
+        if nbytes > self.max_bytes or self.max_entries < 1:
+            return False        # entry does not fit into the budget at all
+        with self.lock:
+            if key in self._entries:
+                self._nbytes -= self._size(self._entries.pop(key))
+            self._entries[key] = entry
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, old = self._entries.popitem(last=False)
+                self._nbytes -= self._size(old)
+                self.evictions += 1
+        return True
+
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+    @staticmethod
+    def _size(entry):
+        return sum(value.nbytes for value in entry.values())
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __contains__(self, key):
+        return key in self._entries
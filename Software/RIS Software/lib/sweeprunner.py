@@ -0,0 +1,127 @@
+import os
+import json
+import multiprocessing
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+try:    # import as package (lib.sweeprunner)
+    from .rissimulator import RISsimulator, sample_directions
+except ImportError:     # import if sweeprunner.py is executed
+    from rissimulator import RISsimulator, sample_directions
+
+
+# worker process state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(out_path, masks, resolution, engine, sampling):
+    sim = RISsimulator()
+    sim.set_resolution(resolution)
+    sim.set_sampling(sampling)
+    sim.set_engine(engine)
+    _worker["sim"] = sim
+    _worker["masks"] = masks
+    _worker["out"] = np.lib.format.open_memmap(out_path, mode="r+")
+
+
+def _run_chunk(index, freq, theta_i, phi_i):
+    # one operating point, all masks at once; results go directly into the shared output file
+    sim, out = _worker["sim"], _worker["out"]
+    sim.set_freq(freq)
+    sim.set_theta_in(theta_i)
+    sim.set_phi_in(phi_i)
+    out[index] = sim.evaluate_masks(_worker["masks"])
+    out.flush()
+    return index
+
+
+###################################################################################################
+#### class definition #############################################################################
+###################################################################################################
+class SweepRunner:
+    """
+    Parameter-Sweep freq x theta_i x phi_i fuer K Masken auf einem Prozess-Pool.
+    Jeder Worker hat einen eigenen RISsimulator und schreibt |AF| direkt in
+    out_dir/af.npy (np.memmap, Form F x Ti x Pi x K x R x R, bzw. F x Ti x Pi x K x P bei
+    sampling="rings"), es werden keine grossen arrays zurueck gepickelt. Abgeschlossene
+    Betriebspunkte stehen in out_dir/done.npy, ein erneuter run() mit gleichen Parametern setzt
+    dort fort.
+    Die Worker werden per spawn gestartet: Skripte, die run() aufrufen, brauchen den Schutz
+    if __name__ == "__main__":, sonst fuehrt jeder Worker das Skript erneut aus.
+    """
+    def __init__(self, out_dir, freqs, theta_i, phi_i, masks, resolution=100, engine="matrix", workers=None,
+                 sampling="grid"):
+        self.out_dir = out_dir
+        self.freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        self.theta_i = np.atleast_1d(np.asarray(theta_i, dtype=float))
+        self.phi_i = np.atleast_1d(np.asarray(phi_i, dtype=float))
+        self.masks = np.asarray(masks, dtype=bool).reshape((-1, 16, 16))
+        self.resolution = resolution
+        self.engine = engine
+        self.sampling = sampling
+        self.workers = workers or os.cpu_count()
+
+        self.grid_shape = (len(self.freqs), len(self.theta_i), len(self.phi_i))
+        self.out_path = os.path.join(out_dir, "af.npy")
+        self.done_path = os.path.join(out_dir, "done.npy")
+        self.meta_path = os.path.join(out_dir, "sweep.json")
+
+
+###################################################################################################
+##### functions ###################################################################################
+###################################################################################################
+    def run(self, progress=print):
+        done = self._open_output()
+        todo = [i for i in np.ndindex(self.grid_shape) if not done[i]]
+        n_total, n_done = done.size, done.size - len(todo)
+        if progress and n_done:
+            progress(f"[sweep] resuming, {n_done}/{n_total} operating points already done")
+
+        start = time.perf_counter()
+        # spawn, not fork: forking after numba's worker threads started hangs the parent at exit
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.out_path, self.masks, self.resolution, self.engine,
+                                           self.sampling)) as pool:
+            futures = [pool.submit(_run_chunk, index, self.freqs[index[0]], self.theta_i[index[1]],
+                                   self.phi_i[index[2]]) for index in todo]
+            for n, future in enumerate(as_completed(futures), start=1):
+                done[future.result()] = True
+                done.flush()            # checkpoint after every finished operating point
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    progress("[sweep] {}/{} operating points, {:.1f} AF/s".format(
+                        n_done + n, n_total, n * len(self.masks) / elapsed))
+        return self.load()
+
+
+    def load(self):
+        return np.load(self.out_path, mmap_mode="r")
+
+
+    def _open_output(self):
+        meta = {
+            "freqs": self.freqs.tolist(),
+            "theta_i": self.theta_i.tolist(),
+            "phi_i": self.phi_i.tolist(),
+            "masks": hashlib.sha1(np.packbits(self.masks).tobytes()).hexdigest(),
+            "n_masks": len(self.masks),
+            "resolution": self.resolution,
+            "sampling": self.sampling,
+        }
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                if json.load(f) != meta:
+                    raise ValueError(f"{self.out_dir} contains a sweep with different parameters")
+            return np.lib.format.open_memmap(self.done_path, mode="r+")
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        shape = self.grid_shape + (len(self.masks),) + sample_directions(self.resolution, self.sampling)[0].shape
+        np.lib.format.open_memmap(self.out_path, mode="w+", dtype=np.float32, shape=shape).flush()
+        done = np.lib.format.open_memmap(self.done_path, mode="w+", dtype=bool, shape=self.grid_shape)
+        with open(self.meta_path, "w") as f:      # written last: marks the output as complete
+            json.dump(meta, f)
+        return done
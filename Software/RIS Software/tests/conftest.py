@@ -0,0 +1,9 @@
+import os
+import sys
+
+
+# the tests import the package as "lib", like main.py does: put "RIS Software" on the path,
+# so plain pytest works from the repository root as well
+RIS_SOFTWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RIS_SOFTWARE not in sys.path:
+    sys.path.insert(0, RIS_SOFTWARE)
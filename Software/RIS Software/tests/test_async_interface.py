@@ -0,0 +1,28 @@
+import asyncio
+
+import numpy as np
+
+from lib.RISinterface_async import AsyncRISinterface
+
+
+def test_get_pattern_round_trip():
+    async def run():
+        ris = AsyncRISinterface("DEMO")
+        await ris.connect()
+        mask = np.zeros((16, 16), dtype=int)
+        mask[0, 0] = 1      # element 1 = MSB
+        assert await ris.set_pattern(mask)
+        return await ris.get_pattern()
+    assert asyncio.run(run()) == (True, "8" + "0" * 63)
+
+
+def test_get_pattern_rejects_other_replies():
+    async def run():
+        ris = AsyncRISinterface("DEMO")
+        await ris.connect()
+
+        async def command(data, timeout=None):
+            return b"#" + b"X" * 66 + b"\n"     # 68 bytes, but no "#0X" pattern reply
+        ris.command = command
+        return await ris.get_pattern()
+    assert asyncio.run(run())[0] is False
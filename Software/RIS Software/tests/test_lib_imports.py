@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+
+
+RIS_SOFTWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(code):
+    # fresh interpreter, the test order must not decide which submodules are loaded
+    return subprocess.run([sys.executable, "-c", code], cwd=RIS_SOFTWARE, capture_output=True,
+                          text=True, timeout=60)
+
+
+def test_risinterface_is_class_after_submodule_import():
+    result = run("import lib\n"
+                 "from lib.rispool import RISpool\n"
+                 "from lib.RISinterface_async import AsyncRISinterface\n"
+                 "print(isinstance(lib.RISinterface, type), lib.RISinterface.__name__)")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["True", "RISinterface"]
+
+
+def test_lazy_class_is_not_hidden_by_its_submodule():
+    result = run("import lib, lib.com_sim, lib.rispool\n"
+                 "print(isinstance(lib.RISpool, type), isinstance(lib.RISSimulatorSerial, type))")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["True", "True"]
+
+
+def test_star_import_is_headless():
+    result = run("import sys\n"
+                 "from lib import *\n"
+                 "print(RISinterface.__name__, RISpool.__name__, 'PySide6' in sys.modules)")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["RISinterface", "RISpool", "False"]
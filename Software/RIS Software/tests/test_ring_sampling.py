@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from lib.rissimulator import ring_counts, ring_faces
+
+
+def edge_counts(faces):
+    # undirected edges of a triangle mesh and how many faces share each
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    return np.unique(np.sort(edges, axis=1), axis=0, return_counts=True)
+
+
+@pytest.mark.parametrize("resolution", [3, 4, 5, 10, 50, 100])
+def test_ring_mesh_is_manifold(resolution):
+    counts = ring_counts(resolution)[1]
+    faces = ring_faces(counts)
+    edges, shared = edge_counts(faces)
+
+    # the horizon ring is the open boundary, every other edge lies between exactly 2 faces
+    horizon = np.arange(counts.sum() - counts[-1], counts.sum())
+    boundary = np.isin(edges, horizon).all(axis=1)
+    assert (shared[boundary] == 1).all()
+    assert (shared[~boundary] == 2).all()
+
+    # consistent winding: no directed edge is used twice
+    directed = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    assert len(np.unique(directed, axis=0)) == len(directed)
+
+
+def test_ring_counts_pole():
+    counts = ring_counts(100)[1]
+    assert counts[0] == 1
+    assert (counts[1:] >= 3).all()
+
+
+def test_ring_faces_rejects_two_point_ring():
+    with pytest.raises(ValueError):
+        ring_faces([1, 2, 4])
@@ -0,0 +1,33 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+
+RIS_SOFTWARE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# numba engine first (starts its worker threads), then a sweep on a process pool
+SWEEP_AFTER_NUMBA = """
+import sys, tempfile
+import numpy as np
+from lib.rissimulator import RISsimulator
+from lib.sweeprunner import SweepRunner
+
+sim = RISsimulator()
+sim.set_resolution(20)
+sim.set_engine("numba")
+sim.get_af()
+masks = np.random.default_rng(0).integers(0, 2, (2, 16, 16))
+with tempfile.TemporaryDirectory() as out_dir:
+    af = SweepRunner(out_dir, [5.5e9], [0.0], [0.0, 1.0], masks, resolution=20, workers=2).run(progress=None)
+    print(af.shape)
+"""
+
+
+def test_sweep_after_numba_exits():
+    pytest.importorskip("numba")
+    result = subprocess.run([sys.executable, "-c", SWEEP_AFTER_NUMBA], cwd=RIS_SOFTWARE,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().endswith("(1, 1, 2, 2, 20, 20)")